@@ -1,29 +1,47 @@
 import os
 import json
 from configuration.configurate_logs import setup_logger
-from dotenv import load_dotenv
-from openai import OpenAI
+from configuration.config import batch_max_requests, batch_max_bytes, batch_upload_workers, batch_max_shard_tokens
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from ResponseCache import ResponseCache, get_cache
+from PromptCompiler import compile_prompt
+from Metrics import get_metrics
+from OpenAiClient import get_openai_client
+from RetryPolicy import get_retry_engine
+from TokenEstimator import get_token_estimator
 import time
 
 logger = setup_logger()
-load_dotenv()
 
 class BatchModule:
-    def __init__(self, model="gpt-5.1"):
-        api_key = os.getenv("OPENAI_API_KEY")
-
-        if not api_key:
-            raise ValueError("❌ OPENAI_API_KEY not found in environment variables!")
-        
-        self.client = OpenAI(api_key=api_key)
+    def __init__(self, model="gpt-5.1", client=None):
+        self.client = client or get_openai_client()
         self.model = model
         self.batch_dir = "batch_files"
 
         if not os.path.exists(self.batch_dir):
             os.makedirs(self.batch_dir)
 
+        self.cache = get_cache()
+        self.metrics = get_metrics()
+        self.estimator = get_token_estimator()
+        # Geschätzte Eingabe-Tokens je erzeugter Eingabedatei (für Budget und Prognose)
+        self.shard_tokens = {}
+
+    #The function returns the response cache key of a batch request (chat completions, no tools).
+    def cache_key(self, instructions, content):
+        return ResponseCache.make_key(self.model, None, [instructions, content])
+
     def PrepareRequestContent(self, item, prompt):
-        product_id = item["product_id"]
+        return prompt.replace("{name}", self.PrepareProductName(item))
+
+    #The function returns (static instructions, per-product content) for the compiled prompt layout.
+    def PrepareRequestMessages(self, item, prompt):
+        compiled = compile_prompt(prompt)
+        return compiled.instructions, compiled.render(self.PrepareProductName(item))
+
+    #The function builds the product designation inserted into the prompt: name plus EAN/UPC.
+    def PrepareProductName(self, item):
         product_name = item.get('name', '')
         manufactorId = ""
         if item.get("ean"):
@@ -32,41 +50,85 @@ class BatchModule:
             manufactorId += item["upc"] + " "
         if manufactorId.strip():
             product_name += ", weitere Herstellernummer: " + manufactorId
-        return prompt.replace("{name}", product_name)
-        
+        return product_name
 
-    #The function creates a local JSONL file with requests for batch processing, substituting product names in the prompt and forming a structure for the API.
-    def create_input_file(self, items, full_prompt):
-        filename = os.path.join(self.batch_dir, f"batch_input_{int(time.time())}.jsonl")
+    #The function builds one JSONL request line for the Batch API and notes its cache key and prompt length in pending_keys.
+    #The estimated input tokens of the request are stored in tokens[0] when tokens is given.
+    def __build_request_line(self, item, full_prompt, pending_keys, tokens=None):
+        product_id = item['product_id']
+        instructions, content = self.PrepareRequestMessages(item, full_prompt)               
+        pending_keys.append((f"product-id-{product_id}", self.cache_key(instructions, content), len(instructions) + len(content)))
+        if tokens is not None:
+            tokens[0] = self.estimator.input_tokens(instructions, content)
         
-        with open(filename, 'w', encoding='utf-8') as f:
+        request_data = {
+            "custom_id": f"product-id-{product_id}", 
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": self.model,
+                "messages": [
+                    # Statischer Teil zuerst, damit der Prompt-Cache des Anbieters greift
+                    {"role": "system", "content": instructions},
+                    {"role": "user", "content": content}
+                ],
+            }
+        }
+        return json.dumps(request_data, ensure_ascii=False) + '\n'
+
+    #The function splits the requests into several JSONL shards, each below max_requests lines, max_bytes bytes
+    #and max_tokens estimated input tokens. It returns a dict {shard filename: [product_id, ...]};
+    #the estimated input tokens of every shard are kept in self.shard_tokens.
+    def create_input_files(self, items, full_prompt, max_requests=batch_max_requests, max_bytes=batch_max_bytes,
+                           max_tokens=batch_max_shard_tokens):
+        prefix = os.path.join(self.batch_dir, f"batch_input_{int(time.time())}")
+        shards = {}
+        pending_keys = []
+        filenames = []
+        f = None
+        count = 0
+        size = 0
+        tokens = [0]
+
+        try:
             for item in items:
-                product_id = item['product_id']
-                content = self.PrepareRequestContent(item, full_prompt)               
-                
-                request_data = {
-                    "custom_id": f"product-id-{product_id}", 
-                    "method": "POST",
-                    "url": "/v1/chat/completions",
-                    "body": {
-                        "model": self.model,
-                        "messages": [
-                            {"role": "user", "content": content}
-                        ],
-                    }
-                }
-                f.write(json.dumps(request_data, ensure_ascii=False) + '\n')
-
-        logger.info(f"✅ Created local input file: {filename} with {len(items)} requests.")
-        return filename
+                with self.metrics.timer("prompt_prep"):
+                    line = self.__build_request_line(item, full_prompt, pending_keys, tokens).encode('utf-8')
+
+                if f is None or count >= max_requests or (count and size + len(line) > max_bytes) \
+                        or (count and self.shard_tokens[filenames[-1]] + tokens[0] > max_tokens):
+                    if f is not None:
+                        f.close()
+                        logger.info(f"✅ Created local input file: {filenames[-1]} with {count} requests.")
+                    filenames.append(f"{prefix}_{len(filenames) + 1}.jsonl")
+                    shards[filenames[-1]] = []
+                    self.shard_tokens[filenames[-1]] = 0
+                    f = open(filenames[-1], 'wb')
+                    count = 0
+                    size = 0
+
+                f.write(line)
+                shards[filenames[-1]].append(item['product_id'])
+                self.shard_tokens[filenames[-1]] += tokens[0]
+                count += 1
+                size += len(line)
+        finally:
+            if f is not None:
+                f.close()
+                logger.info(f"✅ Created local input file: {filenames[-1]} with {count} requests.")
+
+        self.cache.remember_pending(pending_keys)
+        logger.info(f"📦 Split batch input into {len(filenames)} shard(s).")
+        return shards
     
     #The function loads a file with batch queries and launches a new batch processing in the API based on it, returning the created batch job.
     def submit_batch_job(self, input_filepath):
-        logger.info("⬆️ Uploading batch input file...")
-        file_obj = self.client.files.create(
-            file=open(input_filepath, "rb"),
-            purpose="batch"
-        )
+        logger.info(f"⬆️ Uploading batch input file {input_filepath}...")
+        with self.metrics.timer("batch_upload"), open(input_filepath, "rb") as f:
+            file_obj = self.client.files.create(
+                file=f,
+                purpose="batch"
+            )
         logger.info(f"✅ File uploaded. ID: {file_obj.id}")
 
         logger.info("🚀 Creating batch job...")
@@ -78,23 +140,114 @@ class BatchModule:
         logger.info(f"🔥 Batch job created. ID: {batch_job.id}, Status: {batch_job.status}")
         return batch_job
         
+    #The function uploads the shards in parallel and creates one batch job per shard; failed uploads are logged and skipped.
+    #It returns a list of (input_filepath, batch_job) pairs.
+    def submit_batch_jobs(self, input_filepaths, max_parallel=batch_upload_workers):
+        input_filepaths = list(input_filepaths)
+        batch_jobs = []
+        with ThreadPoolExecutor(max_workers=max(1, min(max_parallel, len(input_filepaths)))) as pool:
+            # Uploads laufen über die Retry-Engine (Back-off je Fehlerklasse, gemeinsamer Circuit Breaker)
+            futures = {pool.submit(get_retry_engine().call, self.submit_batch_job, path): path for path in input_filepaths}
+            for future in as_completed(futures):
+                try:
+                    batch_jobs.append((futures[future], future.result()))
+                except Exception as e:
+                    logger.error(f"❌ Failed to submit shard {futures[future]}: {e}")
+
+        logger.info(f"🚀 Submitted {len(batch_jobs)} of {len(input_filepaths)} shard(s) as batch jobs.")
+        return batch_jobs
+
     #The function checks and returns the current status of a batch task by its ID.
     def check_status(self, batch_id):
         try:
-            return self.client.batches.retrieve(batch_id)
+            with self.metrics.timer("batch_status"):
+                return self.client.batches.retrieve(batch_id)
         except Exception as e:
             logger.error(f"Error retrieving batch status for {batch_id}: {e}")
             return None
         
-    #The function loads and returns the text content of the batch file results by its ID
-    def retrieve_results(self, output_file_id):
+    #The function cancels a batch job; returns the updated job or None on error.
+    def cancel_batch(self, batch_id):
         try:
-            file_response = self.client.files.content(output_file_id)
-            return file_response.text 
+            return self.client.batches.cancel(batch_id)
         except Exception as e:
-            logger.error(f"Error retrieving batch results for file {output_file_id}: {e}")
+            logger.error(f"Error cancelling batch {batch_id}: {e}")
             return None
-    
+
+    #The function streams the batch output file to batch_files/ chunk by chunk and yields every complete JSONL line as soon as it arrives,
+    #so results can be applied while the download is still running. An interrupted download leaves a .part file behind;
+    #the next call replays the lines already on disk and requests only the remaining bytes with an HTTP Range header.
+    def stream_results(self, output_file_id, chunk_size=1024 * 1024):
+        final_path = os.path.join(self.batch_dir, f"batch_output_{output_file_id}.jsonl")
+        part_path = final_path + ".part"
+
+        if os.path.exists(final_path):
+            logger.info(f"📄 Output file already downloaded: {final_path}")
+            yield from self.__read_lines(final_path)
+            return
+
+        offset = self.__truncate_to_last_line(part_path) if os.path.exists(part_path) else 0
+        if offset:
+            logger.info(f"⏯️ Resuming download of {output_file_id} at byte {offset}")
+            yield from self.__read_lines(part_path)
+
+        try:
+            headers = {"Range": f"bytes={offset}-"} if offset else None
+            with self.client.files.with_streaming_response.content(output_file_id, extra_headers=headers) as response:
+                # Server hat den Range-Header ignoriert: die bereits vorhandenen Bytes überspringen
+                skip = offset if offset and response.status_code != 206 else 0
+                buffer = b""
+
+                with open(part_path, "ab") as f:
+                    for chunk in response.iter_bytes(chunk_size):
+                        if skip:
+                            dropped = min(skip, len(chunk))
+                            chunk, skip = chunk[dropped:], skip - dropped
+                            if not chunk:
+                                continue
+                        f.write(chunk)
+                        f.flush()
+                        self.metrics.inc("batch_download_bytes_total", len(chunk))
+
+                        buffer += chunk
+                        *lines, buffer = buffer.split(b"\n")
+                        for line in lines:
+                            yield line.decode("utf-8")
+
+                if buffer:
+                    yield buffer.decode("utf-8")
+
+            os.replace(part_path, final_path)
+            logger.info(f"✅ Output file downloaded: {final_path}")
+        except Exception as e:
+            logger.error(f"Error streaming batch results for file {output_file_id}: {e}")
+            raise
+
+    @staticmethod
+    def __read_lines(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                yield line.rstrip("\n")
+
+    #The function cuts an incomplete trailing line off a partial download and returns the resulting size.
+    @staticmethod
+    def __truncate_to_last_line(path):
+        with open(path, "rb+") as f:
+            data_end = f.seek(0, os.SEEK_END)
+            position = data_end
+            while position > 0:
+                step = min(64 * 1024, position)
+                f.seek(position - step)
+                block = f.read(step)
+                newline = block.rfind(b"\n")
+                if newline != -1:
+                    position = position - step + newline + 1
+                    break
+                position -= step
+            if position != data_end:
+                f.truncate(position)
+            return position
+
     #The function checks the status of the batch job and, if it is completed, returns the ID of the output file
     def get_output_file_id(self, batch_job):
         if not batch_job:
@@ -102,39 +255,42 @@ class BatchModule:
 
         output_file_id = batch_job.output_file_id
         
-        if batch_job.status != 'completed':
+        # Auch abgelaufene und abgebrochene Batches liefern die bis dahin fertigen Ergebnisse
+        if batch_job.status not in ('completed', 'expired', 'cancelled'):
             return None, f"Batch is not completed (Status: {batch_job.status})"
 
-        if not output_file_id:
+        # Schlagen alle Anfragen fehl, gibt es nur eine Fehlerdatei; ein früh abgebrochener Batch hat gar keine
+        if not output_file_id and not getattr(batch_job, "error_file_id", None) and batch_job.status != 'cancelled':
             return None, "Completed job has no output file ID."
             
         return output_file_id, None
-    
-    #The function periodically polls the status of the batch job until it completes, and returns the result or an error on failure.
-    def WaitForTaskFinished(self, batch_id, maxWaitTimeMin: int):
-        logger.info(f"⏳ Starting asynchronous wait for batch ID: {batch_id}")
-
-        i = 0
-        while i < maxWaitTimeMin:  
-            i += 1  
-            batch_job = self.check_status(batch_id)
-
-            if not batch_job:
-                logger.error(f"Failed to retrieve job {batch_id}.")
-                return -2
-            
-            status = batch_job.status
 
-            if status == 'completed':
-                logger.info("🎉 Batch job COMPLETED.")
-                return 1
-            
-            elif status in['failed', 'expired', 'cancelled']:
-                logger.error(f"❌ Batch job TERMINATED with status: {status}.")
-                return -3
-            
-            else:
-                logger.info(f"⌛ Job status is: {status}. Waiting {60}s...")
-                time.sleep(60)  
-                
-        return -1
\ No newline at end of file
+    #The function writes a follow-up input file with the original request lines of the given product IDs.
+    #Returns (path, product_ids found) or (None, []) if the original input file is no longer available.
+    def create_followup_file(self, input_filepath, product_ids, generation):
+        if not input_filepath or not os.path.exists(input_filepath):
+            logger.error(f"❌ Original input file {input_filepath} not found, cannot build a follow-up batch.")
+            return None, []
+
+        wanted = {f"product-id-{product_id}" for product_id in product_ids}
+        stem = os.path.splitext(os.path.basename(input_filepath))[0]
+        filename = os.path.join(self.batch_dir, f"{stem}_retry{generation}_{int(time.time())}.jsonl")
+        found = []
+        tokens = 0
+        with open(input_filepath, "r", encoding="utf-8") as source, open(filename, "w", encoding="utf-8") as target:
+            for line in source:
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                custom_id = request.get("custom_id")
+                if custom_id in wanted:
+                    target.write(line if line.endswith("\n") else line + "\n")
+                    found.append(int(custom_id.split("-")[-1]))
+                    tokens += self.estimator.input_tokens(*(message["content"] for message in request["body"]["messages"]))
+
+        if not found:
+            os.remove(filename)
+            return None, []
+        self.shard_tokens[filename] = tokens
+        logger.info(f"✅ Created follow-up input file: {filename} with {len(found)} requests.")
+        return filename, found
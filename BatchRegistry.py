@@ -0,0 +1,260 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+from configuration.configurate_logs import setup_logger
+from configuration.config import batch_registry_path, batch_poll_base_delay, batch_poll_max_delay
+
+logger = setup_logger()
+
+# 'expired' ist kein Endzustand: die bis dahin fertigen Ergebnisse werden übernommen, der Rest neu eingereicht.
+# Ein vom Hybrid-Modus abgebrochener (promoted) Batch bleibt offen, bis seine fertigen Ergebnisse übernommen sind.
+TERMINAL_STATES = ('failed', 'cancelled')
+OPEN_WHERE = f"applied_at IS NULL AND (state NOT IN ({', '.join(repr(state) for state in TERMINAL_STATES)}) OR promoted = 1)"
+
+class BatchRegistry:
+    def __init__(self, path=batch_registry_path):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        with self.lock, self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS batches (
+                    batch_id TEXT PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    input_file TEXT,
+                    input_file_id TEXT,
+                    output_file_id TEXT,
+                    error_file_id TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    next_poll_at REAL NOT NULL,
+                    poll_attempts INTEGER NOT NULL DEFAULT 0,
+                    applied_at REAL
+                );
+                CREATE TABLE IF NOT EXISTS batch_items (
+                    batch_id TEXT NOT NULL,
+                    product_id INTEGER NOT NULL,
+                    PRIMARY KEY (batch_id, product_id)
+                );
+                CREATE INDEX IF NOT EXISTS idx_batches_open ON batches (applied_at, state, next_poll_at);
+            """)
+            columns = [row["name"] for row in self.connection.execute("PRAGMA table_info(batch_items)")]
+            if "representative_id" not in columns:
+                self.connection.execute("ALTER TABLE batch_items ADD COLUMN representative_id INTEGER")
+            if "fingerprint" not in columns:
+                self.connection.execute("ALTER TABLE batch_items ADD COLUMN fingerprint TEXT")
+            columns = [row["name"] for row in self.connection.execute("PRAGMA table_info(batches)")]
+            if "parent_batch_id" not in columns:
+                self.connection.execute("ALTER TABLE batches ADD COLUMN parent_batch_id TEXT")
+                self.connection.execute("ALTER TABLE batches ADD COLUMN generation INTEGER NOT NULL DEFAULT 0")
+            if "est_tokens" not in columns:
+                self.connection.execute("ALTER TABLE batches ADD COLUMN est_tokens INTEGER")
+            if "promoted" not in columns:
+                self.connection.execute("ALTER TABLE batches ADD COLUMN promoted INTEGER NOT NULL DEFAULT 0")
+
+    #The function stores a freshly submitted batch job together with the product IDs it contains.
+    #members maps a requested product_id to all product IDs of its duplicate group.
+    #Follow-up batches for failed items carry their parent batch and the resubmission generation;
+    #est_tokens are the estimated input tokens that count against the enqueued-token limit;
+    #fingerprints maps product IDs to the input fingerprint of the request, written with the result.
+    def register(self, batch_job, product_ids, input_file=None, members=None, parent_batch_id=None, generation=0, est_tokens=None,
+                 fingerprints=None):
+        members = members or {}
+        fingerprints = fingerprints or {}
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute(
+                """INSERT OR IGNORE INTO batches
+                       (batch_id, state, input_file, input_file_id, created_at, updated_at, next_poll_at, parent_batch_id, generation, est_tokens)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (batch_job.id, batch_job.status, input_file, getattr(batch_job, "input_file_id", None), now, now, now,
+                 parent_batch_id, generation, est_tokens)
+            )
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO batch_items (batch_id, product_id, representative_id, fingerprint) VALUES (?, ?, ?, ?)",
+                [
+                    (batch_job.id, member_id, product_id, fingerprints.get(member_id))
+                    for product_id in product_ids
+                    for member_id in members.get(product_id, [product_id])
+                ]
+            )
+
+    def get(self, batch_id):
+        with self.lock:
+            return self.connection.execute("SELECT * FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+
+    #The function returns {requested product_id: [all product IDs of its group]} for a batch.
+    def group_members(self, batch_id):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT product_id, COALESCE(representative_id, product_id) AS representative_id FROM batch_items WHERE batch_id = ?",
+                (batch_id,)
+            ).fetchall()
+        members = {}
+        for row in rows:
+            members.setdefault(row["representative_id"], []).append(row["product_id"])
+        return members
+
+    #The function returns {product_id: input fingerprint} of a batch (without items registered before fingerprints existed).
+    def fingerprints(self, batch_id):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT product_id, fingerprint FROM batch_items WHERE batch_id = ? AND fingerprint IS NOT NULL", (batch_id,)
+            ).fetchall()
+        return {row["product_id"]: row["fingerprint"] for row in rows}
+
+    #The function returns the product IDs of all batches that are still open.
+    def open_item_ids(self):
+        with self.lock:
+            rows = self.connection.execute(
+                f"""SELECT i.product_id FROM batch_items AS i
+                    WHERE i.batch_id IN (SELECT batch_id FROM batches WHERE {OPEN_WHERE})"""
+            ).fetchall()
+        return {row["product_id"] for row in rows}
+
+    #The function returns the estimated input tokens of all batches the provider has not finished yet.
+    def enqueued_tokens(self):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT COALESCE(SUM(est_tokens), 0) AS tokens FROM batches WHERE state IN ('validating', 'in_progress', 'finalizing')"
+            ).fetchone()
+        return row["tokens"]
+
+    #The function returns the given batch IDs plus all follow-up batches that were submitted for them.
+    def with_followups(self, batch_ids):
+        batch_ids = list(batch_ids)
+        with self.lock:
+            index = 0
+            while index < len(batch_ids):
+                rows = self.connection.execute("SELECT batch_id FROM batches WHERE parent_batch_id = ?", (batch_ids[index],)).fetchall()
+                batch_ids += [row["batch_id"] for row in rows if row["batch_id"] not in batch_ids]
+                index += 1
+        return batch_ids
+
+    #The function returns all batches whose results are not applied yet and that did not terminate with an error.
+    def open_batches(self, batch_ids=None):
+        sql = f"SELECT * FROM batches WHERE {OPEN_WHERE}"
+        params = []
+        if batch_ids is not None:
+            sql += f" AND batch_id IN ({', '.join('?' * len(batch_ids))})"
+            params += list(batch_ids)
+        with self.lock:
+            return self.connection.execute(sql + " ORDER BY next_poll_at", params).fetchall()
+
+    #The function stores the latest status of a batch and when it should be polled next.
+    def update_status(self, batch_id, state, output_file_id=None, error_file_id=None, next_poll_at=None, poll_attempts=None):
+        with self.lock, self.connection:
+            self.connection.execute(
+                """UPDATE batches
+                   SET state = ?,
+                       output_file_id = COALESCE(?, output_file_id),
+                       error_file_id = COALESCE(?, error_file_id),
+                       next_poll_at = COALESCE(?, next_poll_at),
+                       poll_attempts = COALESCE(?, poll_attempts),
+                       updated_at = ?
+                   WHERE batch_id = ?""",
+                (state, output_file_id, error_file_id, next_poll_at, poll_attempts, time.time(), batch_id)
+            )
+
+    #The function marks a batch that was cancelled to promote its items: it is polled again right away, its finished
+    #answers are applied once the provider reports 'cancelled', and only the unanswered items go to the synchronous path.
+    def mark_promoted(self, batch_id):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "UPDATE batches SET promoted = 1, next_poll_at = ?, poll_attempts = 0, updated_at = ? WHERE batch_id = ?",
+                (time.time(), time.time(), batch_id)
+            )
+
+    def mark_applied(self, batch_id):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "UPDATE batches SET applied_at = ?, updated_at = ? WHERE batch_id = ?",
+                (time.time(), time.time(), batch_id)
+            )
+
+class BatchPoller:
+    #on_failed(batch_id) is called once when a batch fails as a whole, e.g. to resubmit its items.
+    def __init__(self, batch_module, registry, apply_results, base_delay=batch_poll_base_delay, max_delay=batch_poll_max_delay,
+                 on_failed=None):
+        self.batch_module = batch_module
+        self.registry = registry
+        self.apply_results = apply_results
+        self.on_failed = on_failed
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    #The function watches all open batches (or only batch_ids) at once and applies the results of every batch that completes.
+    #Each batch is polled on its own exponential back-off schedule with jitter. max_wait_seconds=0 does a single pass.
+    #Follow-up batches submitted for failed items of batch_ids are watched as well.
+    def run(self, max_wait_seconds=None, batch_ids=None):
+        deadline = time.time() + max_wait_seconds if max_wait_seconds is not None else None
+        logger.info(f"⏳ Polling {len(self.registry.open_batches(batch_ids))} open batch job(s)")
+
+        while True:
+            now = time.time()
+            for row in self.registry.open_batches(batch_ids):
+                if row["next_poll_at"] <= now:
+                    self.__poll(row)
+            if batch_ids is not None:
+                batch_ids = self.registry.with_followups(batch_ids)
+
+            open_batches = self.registry.open_batches(batch_ids)
+            if not open_batches:
+                logger.info("🎉 No open batch jobs left.")
+                return True
+
+            if deadline is not None and time.time() >= deadline:
+                logger.info(f"⌛ {len(open_batches)} batch job(s) still open — they will be picked up by the next poll run.")
+                return False
+
+            wake_up = min(row["next_poll_at"] for row in open_batches)
+            if deadline is not None:
+                wake_up = min(wake_up, deadline)
+            time.sleep(max(wake_up - time.time(), 1.0))
+
+    def __poll(self, row):
+        batch_id = row["batch_id"]
+        batch_job = self.batch_module.check_status(batch_id)
+
+        if not batch_job:
+            self.__schedule(row, row["state"])
+            return
+
+        status = batch_job.status
+        self.registry.update_status(
+            batch_id, status,
+            output_file_id=getattr(batch_job, "output_file_id", None),
+            error_file_id=getattr(batch_job, "error_file_id", None)
+        )
+
+        if status in ('completed', 'expired') or (status == 'cancelled' and row["promoted"]):
+            if status == 'completed':
+                logger.info(f"🎉 Batch job {batch_id} COMPLETED.")
+            elif status == 'expired':
+                logger.warning(f"⌛ Batch job {batch_id} EXPIRED, applying the finished part.")
+            else:
+                logger.info(f"⏫ Promoted batch job {batch_id} CANCELLED, applying the finished part.")
+            if self.apply_results(batch_id):
+                self.registry.mark_applied(batch_id)
+            else:
+                self.__schedule(row, status)
+        elif status in TERMINAL_STATES:
+            logger.error(f"❌ Batch job {batch_id} TERMINATED with status: {status}.")
+            if status == 'failed' and self.on_failed:
+                self.on_failed(batch_id)
+        else:
+            delay = self.__schedule(row, status)
+            logger.info(f"⌛ Job {batch_id} status is: {status}. Next check in {delay:.0f}s")
+
+    def __schedule(self, row, status):
+        attempts = row["poll_attempts"] + 1
+        delay = min(self.max_delay, self.base_delay * 2 ** min(attempts - 1, 16))
+        delay = random.uniform(delay / 2, delay)
+        self.registry.update_status(row["batch_id"], status, next_poll_at=time.time() + delay, poll_attempts=attempts)
+        return delay
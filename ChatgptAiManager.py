@@ -1,51 +1,104 @@
-import json
-from openai import OpenAI
-import os
-from dotenv import load_dotenv
+import time
 from configuration.configurate_logs import setup_logger
+from configuration.config import sync_streaming, oe_kb_enabled, oe_kb_prompt_hint
+from ResponseCache import ResponseCache, get_cache
+from PromptCompiler import compile_prompt
+from Metrics import get_metrics
+from OpenAiClient import get_openai_client
+from ResponseSchema import IncrementalJsonValidator, SchemaViolation, ResponseAborted
+from JsonRepair import parse_model_json, RepairFailed
+from TokenEstimator import get_token_estimator
+from OeKnowledgeBase import get_oe_knowledge_base, fill_from_index
 
-load_dotenv()
+logger = setup_logger()
 
 class ChatgptAiManager:
-    def __init__(self):
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("❌ OPENAI_API_KEY not found in .env file!")
-        self.client = OpenAI(api_key=api_key)
+    def __init__(self, client=None):
+        self.client = client or get_openai_client()
+        self.model = "gpt-5.1"
+        self.max_output_tokens = 4000
+        self.tools = [
+            {
+                # laut aktueller Doku: Web-Suche über Responses API
+                "type": "web_search"
+            }
+        ]
+        self.streaming = sync_streaming
+        self.cache = get_cache()
+        self.metrics = get_metrics()
+        self.oe_kb = get_oe_knowledge_base() if oe_kb_enabled else None
+
+    #The function returns the response cache key of a synchronous request.
+    def cache_key(self, instructions, prompt_text):
+        return ResponseCache.make_key(self.model, self.tools, [instructions, prompt_text])
 
     def generate_description(self, product_name, prompt_text):
-        final_prompt = prompt_text.replace("{name}", product_name)
+        compiled = compile_prompt(prompt_text)
 
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-5.1",
-                messages=[{"role": "user", "content": final_prompt}],
-                temperature=0
-            )
+            with self.metrics.timer("openai_request"):
+                response = self.client.chat.completions.create(
+                    model="gpt-5.1",
+                    messages=[
+                        {"role": "system", "content": compiled.instructions},
+                        {"role": "user", "content": compiled.render(product_name)}
+                    ],
+                    temperature=0
+                )
+            self.metrics.inc("api_requests_total", api="chat", outcome="ok")
+            self.log_usage(getattr(response, "usage", None), api="chat",
+                           chars=len(compiled.instructions) + len(compiled.render(product_name)))
 
             raw_text = response.choices[0].message.content
-            clean = raw_text.replace("```json", "").replace("```", "").strip()
-
             try:
-                return json.loads(clean)
-            except:
+                return parse_model_json(raw_text, "chat")
+            except RepairFailed:
                 return {"raw_response": raw_text}
 
         except Exception as e:
+            self.metrics.inc("api_requests_total", api="chat", outcome="error")
             return {"error": str(e)}
     
-    def call_itemdesc_with_browsing(self, prompt_text):
-        response = self.client.responses.create(
-            model="gpt-5.1",
-            input=prompt_text,
-            max_output_tokens=4000,
-            tools=[
-                {
-                    # laut aktueller Doku: Web-Suche über Responses API
-                    "type": "web_search"
-                }
-            ],
+    #instructions carries the static prompt prefix (see PromptCompiler), prompt_text the per-product part.
+    #oe_numbers are the product's own numbers: when the OE knowledge base knows all of them, the request goes out without
+    #web search and the compatibility table and sources come from the index; otherwise the answer is added to the index.
+    def call_itemdesc_with_browsing(self, prompt_text, instructions=None, oe_numbers=None):
+        known = self.oe_kb.lookup(oe_numbers) if self.oe_kb and oe_numbers else None
+        request = dict(
+            model=self.model,
+            input=prompt_text + oe_kb_prompt_hint if known else prompt_text,
+            max_output_tokens=self.max_output_tokens,
         )
+        if known:
+            logger.info(f"📚 OE numbers {', '.join(oe_numbers)} known, requesting without web search")
+        else:
+            request["tools"] = self.tools
+        if instructions:
+            request["instructions"] = instructions
+
+        if self.streaming:
+            result = self.__stream_response(request)
+        else:
+            result = self.__complete_response(request)
+
+        if known:
+            fill_from_index(result, known)
+        elif self.oe_kb:
+            self.oe_kb.learn(result, oe_numbers)
+        # Unter dem Schlüssel der ursprünglichen Anfrage ablegen, damit der nächste Lauf den Cache trifft
+        self.cache.put(self.cache_key(instructions, prompt_text), result)
+        return result
+
+    #The function sends the request without streaming and parses the complete answer.
+    def __complete_response(self, request):
+        try:
+            with self.metrics.timer("openai_request"):
+                response = self.client.responses.create(**request)
+        except Exception as e:
+            self.metrics.inc("api_requests_total", api="responses", outcome=str(getattr(e, "status_code", None) or "error"))
+            raise
+        self.metrics.inc("api_requests_total", api="responses", outcome="ok")
+        self.log_usage(getattr(response, "usage", None), api="responses", chars=self.__request_chars(request))
 
         try:
             json_text = response.output_text
@@ -53,10 +106,73 @@ class ChatgptAiManager:
             # Fallback auf die generische Struktur
             json_text = response.output[0].content[0].text
         
-        # Vom Modell geliefertes JSON in Python-Objekt parsen
+        # Vom Modell geliefertes JSON in Python-Objekt parsen (bei Bedarf lokal repariert)
+        try:
+            with self.metrics.timer("json_parse"):
+                result = parse_model_json(json_text, "responses")
+        except RepairFailed as e:
+            logger.error(f"❌ Konnte das JSON nicht parsen ({e}). Rohtext: {json_text[:500]}")
+            raise
+
+        return result
+
+    #The function streams the answer as server-sent events through the IncrementalJsonValidator. At the first schema
+    #violation the stream is closed, which also stops the generation. The text received so far is then repaired locally
+    #if possible (e.g. a truncated compatibility list); otherwise ResponseAborted is raised and the retry engine decides.
+    def __stream_response(self, request):
+        validator = IncrementalJsonValidator()
+        started = time.perf_counter()
         try:
-            return json.loads(json_text)
-        except json.JSONDecodeError:
-            print("Konnte das JSON nicht parsen. Rohtext:")
-            print(json_text)
-            raise
\ No newline at end of file
+            stream = self.client.responses.create(stream=True, **request)
+        except Exception as e:
+            self.metrics.inc("api_requests_total", api="responses", outcome=str(getattr(e, "status_code", None) or "error"))
+            raise
+
+        try:
+            with stream:
+                for event in stream:
+                    if event.type == "response.output_text.delta":
+                        validator.feed(event.delta)
+                    elif event.type == "response.completed":
+                        self.log_usage(getattr(event.response, "usage", None), api="responses", chars=self.__request_chars(request))
+                    elif event.type in ("response.incomplete", "response.failed"):
+                        self.log_usage(getattr(event.response, "usage", None), api="responses", chars=self.__request_chars(request))
+                        raise SchemaViolation("incomplete", f"response {event.type.split('.')[-1]}")
+
+            with self.metrics.timer("json_parse"):
+                result = parse_model_json(validator.finish(), "responses")
+        except (SchemaViolation, RepairFailed) as e:
+            elapsed = time.perf_counter() - started
+            self.metrics.inc("stream_aborts_total", reason=getattr(e, "kind", "invalid"))
+            self.metrics.observe("stage_seconds", elapsed, stage="openai_request_aborted")
+            try:
+                result = parse_model_json("".join(validator.chunks), "responses")
+            except RepairFailed:
+                self.metrics.inc("api_requests_total", api="responses", outcome="aborted")
+                logger.warning(f"✂️ Response aborted after {validator.position} chars / {elapsed:.1f}s: {e} "
+                               f"(complete fields: {', '.join(validator.fields) or '-'})")
+                raise ResponseAborted(str(e), validator.position) from e
+            logger.warning(f"✂️ Response stopped after {validator.position} chars / {elapsed:.1f}s ({e}), using the repaired answer")
+            self.metrics.inc("api_requests_total", api="responses", outcome="repaired")
+            return result
+        except Exception as e:
+            self.metrics.inc("api_requests_total", api="responses", outcome=str(getattr(e, "status_code", None) or "error"))
+            raise
+
+        self.metrics.inc("api_requests_total", api="responses", outcome="ok")
+        self.metrics.observe("stage_seconds", time.perf_counter() - started, stage="openai_request")
+        return result
+
+    @staticmethod
+    def __request_chars(request):
+        return len(request.get("instructions") or "") + len(request["input"])
+
+    #The function logs input, cached input and output tokens of a Responses or Chat Completions call, adds them to the metrics
+    #and calibrates the token estimator with them (chars = length of the prompt texts sent).
+    @staticmethod
+    def log_usage(usage, api="responses", chars=None):
+        if usage is None:
+            return
+        input_tokens, cached_tokens, output_tokens = get_metrics().record_usage(usage, api)
+        get_token_estimator().observe(api, input_tokens, cached_tokens, output_tokens, chars)
+        logger.info(f"🧮 Tokens: input={input_tokens} (cached={cached_tokens}) output={output_tokens}")
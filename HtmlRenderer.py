@@ -0,0 +1,125 @@
+import re
+from html import escape
+
+# Zeilenumbruch nach jedem Satzende im Verkaufstext
+SENTENCE_BREAK = re.compile(r"(?<=\.)\s+")
+# Vom Modell gelieferte <br>-Tags überleben das Escaping
+ESCAPED_BR = re.compile(r"&lt;br\s*/?&gt;", re.IGNORECASE)
+
+# Zellen, Zeilen und Motorvarianten werden für eine gemeinsame escape-Runde mit Steuerzeichen getrennt.
+# Enthält ein Wert selbst eines davon, stimmt ihre Anzahl nicht und die Tabelle wird Zelle für Zelle escaped.
+CELL, ROW, VARIANT = "\x01", "\x02", "\x03"
+TABLE_HEAD = (
+    "<table class='item-compability-table'>"
+    "<tr><th>Marke</th><th>Modell</th><th>Baujahr</th><th>Motorvarianten</th><th>Bemerkung</th></tr>"
+)
+TABLE_END = "</table>"
+
+DESCRIPTION = "<div class='item-desc-text'>{}</div> {}"
+AI_SECTION = "<div class='addedTextAi'><div class='item-desc-text'>{}</div>{}{}</div>"
+# Erkennung des generierten Rahmens früherer Läufe (auch wenn ein Editor Anführungszeichen oder Leerraum geändert hat)
+DESCRIPTION_START = re.compile(r"""^\s*<div class=["']item-desc-text["']>""")
+AI_SECTION_START = re.compile(r"""</div>\s*<div class=["']addedTextAi["']>""")
+OE_BLOCK = "<div class='item-oe-nummer'>OE-Nummer: {}</div>"
+COMPATIBILITY_BLOCK = "<div class='item-compability-block'><h4>Kompatibilitätsliste (ohne Gewähr)</h4>{}</div>"
+
+def _text(value):
+    if value is None:
+        return ""
+    return escape(value if isinstance(value, str) else str(value), quote=False)
+
+#The function escapes the sales text and inserts a line break after every sentence.
+def render_sales_text(text):
+    html = ESCAPED_BR.sub("<br/>", _text(text))
+    return SENTENCE_BREAK.sub("<br/>", html)
+
+#The function joins a list into an escaped, comma separated string.
+def render_list(array):
+    if not array or not isinstance(array, list):
+        return ""
+    return ", ".join(_text(value) for value in array)
+
+#The function renders the compatibility list as an HTML table: one f-string per row and one escape pass over the
+#whole table text (skipped when nothing needs escaping), after which the separators are replaced by the tags.
+def render_compatibility_table(array):
+    if not array or not isinstance(array, list):
+        return ""
+
+    rows = [item for item in array if isinstance(item, dict)]
+    if not rows:
+        return ""
+    variants = [_variants(item) for item in rows]
+    text = ROW.join([
+        f"{item.get('marke') or ''}\x01{item.get('modell') or ''}\x01"
+        f"{item.get('baujahr_von') or ''} - {item.get('baujahr_bis') or ''}\x01"
+        f"{_join_variants(row_variants)}\x01{item.get('bemerkung') or ''}"
+        for item, row_variants in zip(rows, variants)
+    ])
+    variant_breaks = sum(len(row_variants) - 1 for row_variants in variants if row_variants)
+    if text.count(CELL) != 4 * len(rows) or text.count(ROW) != len(rows) - 1 or text.count(VARIANT) != variant_breaks:
+        return TABLE_HEAD + "".join([_table_row(item) for item in rows]) + TABLE_END
+
+    if "&" in text or "<" in text or ">" in text:
+        text = escape(text, quote=False)
+    html = text.replace(CELL, "</td><td>").replace(ROW, "</td></tr><tr><td>").replace(VARIANT, "<br>")
+    return TABLE_HEAD + "<tr><td>" + html + "</td></tr>" + TABLE_END
+
+# Ein einzelner Wert statt einer Liste ist eine Motorvariante
+def _variants(item):
+    variants = item.get('motorvarianten') or ()
+    return variants if isinstance(variants, (list, tuple)) else (variants,)
+
+def _join_variants(variants):
+    try:
+        return VARIANT.join(variants)
+    except TypeError:
+        # Motorvarianten mit Nicht-Strings (Zahlen, null) dieser einen Zeile
+        return VARIANT.join(["" if variant is None else str(variant) for variant in variants])
+
+#The function renders one table row with every cell escaped on its own (for values that contain the separators).
+def _table_row(item):
+    cells = (
+        _text(item.get('marke') or ''),
+        _text(item.get('modell') or ''),
+        _text(item.get('baujahr_von') or '') + " - " + _text(item.get('baujahr_bis') or ''),
+        "<br>".join([_text(variant) for variant in _variants(item)]),
+        _text(item.get('bemerkung') or ''),
+    )
+    return "<tr><td>" + "</td><td>".join(cells) + "</td></tr>"
+
+#The function returns the shop's own description without the AI sections written by earlier runs.
+#Descriptions from before this merge contain one wrapper per run nested inside each other; all of them are removed.
+def strip_ai_sections(description):
+    description = description or ""
+    while True:
+        start = DESCRIPTION_START.match(description)
+        sections = list(AI_SECTION_START.finditer(description))
+        if not start or not sections:
+            return description
+        # Der zuletzt angehängte AI-Block gehört zum äußersten Rahmen
+        description = description[start.end():sections[-1].start()]
+
+#The function renders everything that depends only on the model answer: the AI section HTML and the SEO fields.
+#It needs no database access, so batch results are rendered in the parser threads before they reach the writers.
+def render_ai_section(response_json):
+    oenummer = render_list(response_json.get("OE-Nummer"))
+    compare_text = render_compatibility_table(response_json.get("kompatibilität"))
+
+    ai_section = AI_SECTION.format(
+        render_sales_text(response_json.get("Verkaufstext", "")),
+        OE_BLOCK.format(oenummer) if oenummer else "",
+        COMPATIBILITY_BLOCK.format(compare_text) if compare_text else "",
+    )
+    meta_title = response_json.get("titel", "")
+    meta_keyword = response_json.get("Kurzbeschreibung", "")
+    tag_seo = response_json.get("SEO", "")
+    return ai_section, meta_title, meta_keyword, tag_seo
+
+#The function renders the new description HTML and the SEO fields for one product response.
+#old_description is stored shop HTML; an AI section of an earlier run is replaced instead of being wrapped again,
+#so reprocessing a product yields the same output. Everything from the model is escaped.
+#section is the result of render_ai_section when it was already rendered.
+def render_description(old_description, response_json, section=None):
+    ai_section, meta_title, meta_keyword, tag_seo = section or render_ai_section(response_json)
+    full_description = DESCRIPTION.format(strip_ai_sections(old_description), ai_section)
+    return full_description, meta_title, meta_keyword, tag_seo
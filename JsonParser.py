@@ -1,17 +1,35 @@
-from configuration.configurate_logs import setup_logger
+from configuration.configurate_logs import setup_logger, log_payload
 from OpenCartModul import OpencartProductController
+from configuration.config import bulk_chunk_size, apply_parse_workers, apply_parse_chunk_lines, apply_db_writers, oe_kb_enabled
+from ResponseCache import get_cache
+from ProductGrouper import fan_out
+from Metrics import get_metrics
+from JsonRepair import parse_model_json, RepairFailed
+from TokenEstimator import get_token_estimator
+from HtmlRenderer import render_ai_section
+from OeKnowledgeBase import get_oe_knowledge_base, product_numbers
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, ALL_COMPLETED
 import json
+import threading
 
 logger = setup_logger()
 
 class JsonParser:
-    def __init__(self):
-        self.opencart = OpencartProductController()      
+    def __init__(self, opencart=None):
+        self.opencart = opencart or OpencartProductController()
+        self.cache = get_cache()
+        self.oe_kb = get_oe_knowledge_base() if oe_kb_enabled else None
+        self.metrics = get_metrics()
+        self.token_totals = {"input": 0, "cached": 0, "output": 0}
+        self.answered_ids = set()
+        self.request_chars = {}
+        self.lock = threading.Lock()
     
-    #The function parses JSONL text line by line, returning JSON objects and logging decoding errors.
+    #The function parses JSONL text (or any iterable of lines, e.g. a download stream) line by line, returning JSON objects and logging decoding errors.
     @staticmethod
     def parse_jsonl_results(json_results_text):
-        for line in json_results_text.splitlines():
+        lines = json_results_text.splitlines() if isinstance(json_results_text, str) else json_results_text
+        for line in lines:
             line = line.strip()
             if line:
                 try:
@@ -23,14 +41,14 @@ class JsonParser:
     #The function processes the result of a single product from a batch query
     def process_single_batch_result(self, data):
         product_id = None
+        response_json = None
         content_json = None
-        log_output = None
         error_message = None
 
         try:
             custom_id = data.get('custom_id')
             if not custom_id:
-                return None, None, None, "Missing custom_id"
+                return None, None, "Missing custom_id"
 
             product_id = int(custom_id.split('-')[-1])
             response_obj = data.get('response')
@@ -38,52 +56,202 @@ class JsonParser:
             
             if response_obj:
                 response_json = response_obj.get('body')
+                if response_obj.get('status_code', 200) != 200:
+                    error_message = ((response_json or {}).get('error') or {}).get('message') or f"HTTP {response_obj.get('status_code')}"
+                    response_json = None
             if error_obj:
                 error_message = error_obj.get('message')
 
             if response_json:
+                self.__count_usage(response_json.get("usage"), self.request_chars.get(custom_id))
+
                 # 2. Den inneren JSON-String aus content holen
                 content_str = response_json["choices"][0]["message"]["content"]
 
-                # 3. Inneren JSON-String erneut parsen
-                content_json = json.loads(content_str)
-                
-                pretty_json = json.dumps(content_json, indent=2, ensure_ascii=False)
-                log_output = f"\n=== ✅ Product {product_id} Response Start ===\n"
-                log_output += pretty_json
-                log_output += f"\n=== Product {product_id} Response End ===\n"
-            
+                # 3. Inneren JSON-String erneut parsen (Zäune, Fließtext, Abschneiden werden lokal repariert)
+                with self.metrics.timer("json_parse"):
+                    content_json = parse_model_json(content_str, "batch")
+                log_payload(logger, f"✅ Product {product_id} Response", content_json)
+
+        except RepairFailed as e:
+            error_message = f"Unusable answer, not repairable: {e}"
         except Exception as e:
             logger.error(f"💥 Error inside process_single_batch_result for {data.get('custom_id')}: {e}")
             error_message = f"Internal parsing error: {e}"
             
-        return product_id, content_json, log_output, error_message
+        return product_id, content_json, error_message
     
     #The function processes a JSONL result set (with multiple products) and updates the corresponding products in the database.
-    def process_batch_results(self, jsonl_results_text):
-        successful_updates = 0
-        
-        for data in self.parse_jsonl_results(jsonl_results_text):
+    #It runs as a pipeline: the caller's thread reads the lines (e.g. from the download stream), apply_parse_workers threads
+    #decode, validate and render them in packets of apply_parse_chunk_lines, and apply_db_writers threads write the results
+    #in chunks of bulk_chunk_size through UpdateItemsBulk. Each stage has at most 2 x workers packets in flight; a full stage
+    #blocks the one before it, so memory stays bounded and the throughput is set by the database.
+    #group_members maps a requested product_id to all duplicate product IDs that receive the same result.
+    #The requested product IDs whose answer was written (the bulk chunks of all their group members committed) are
+    #collected in self.answered_ids; items of a rolled-back chunk stay unanswered and are resubmitted.
+    #fingerprints maps product IDs to the input fingerprint recorded when the batch was built.
+    def process_batch_results(self, jsonl_results_text, group_members=None, fingerprints=None):
+        self.token_totals = {"input": 0, "cached": 0, "output": 0}
+        self.answered_ids = set()
+        # Promptlängen der Anfragen (beim Erstellen der Eingabedatei gemerkt) kalibrieren die Token-Schätzung
+        self.request_chars = self.__request_chars(group_members or {})
+        pipeline = {"members": group_members or {}, "fingerprints": fingerprints or {}, "pending": [], "parsing": set(),
+                    "writing": set(), "updated": 0}
+
+        with ThreadPoolExecutor(max_workers=apply_db_writers, thread_name_prefix="db-writer") as writers, \
+             ThreadPoolExecutor(max_workers=apply_parse_workers, thread_name_prefix="result-parser") as parsers:
+            try:
+                for lines in self.__packets(jsonl_results_text, apply_parse_chunk_lines):
+                    pipeline["parsing"].add(parsers.submit(self.__parse_lines, lines))
+                    if len(pipeline["parsing"]) >= 2 * apply_parse_workers:
+                        self.__collect(pipeline, writers, FIRST_COMPLETED)
+            finally:
+                # Auch bei abgebrochenem Download die bereits gelesenen Ergebnisse schreiben
+                self.__collect(pipeline, writers, ALL_COMPLETED)
+                if pipeline["pending"]:
+                    self.__submit_write(pipeline, writers)
+                self.__drain_writes(pipeline, ALL_COMPLETED)
+
+        logger.info(f"🎉 Batch results processing finished. Updated {pipeline['updated']} products.")
+        totals = self.token_totals
+        logger.info(f"🧮 Batch tokens: input={totals['input']} (cached={totals['cached']}) output={totals['output']}")
+
+    def __request_chars(self, group_members):
+        try:
+            return self.cache.pending_chars(f"product-id-{product_id}" for product_id in group_members)
+        except Exception as e:
+            logger.error(f"❌ Response cache error: {e}")
+            return {}
+
+    #The function groups the non-empty lines of JSONL text (or any iterable of lines) into lists of size lines.
+    @staticmethod
+    def __packets(json_results_text, size):
+        lines = json_results_text.splitlines() if isinstance(json_results_text, str) else json_results_text
+        packet = []
+        for line in lines:
+            line = line.strip()
+            if line:
+                packet.append(line)
+                if len(packet) >= size:
+                    yield packet
+                    packet = []
+        if packet:
+            yield packet
+
+    #The function runs in a parser thread: it decodes one packet of lines and renders the AI section of every usable answer.
+    #Returns (product_id, response_json, section) for answers and logs the failed ones.
+    def __parse_lines(self, lines):
+        parsed = []
+        for data in self.parse_jsonl_results(lines):
             product_id = -1
             try:
-                product_id, response_json, log_output, error_message = \
-                    self.process_single_batch_result(data)
-                
+                product_id, response_json, error_message = self.process_single_batch_result(data)
+
                 if not product_id or not isinstance(product_id, int):
                     continue
 
                 if response_json:
-                    if log_output:
-                        # print(log_output)
-                        logger.info(log_output)
-
-                    self.opencart.ProcessProduct(product_id, response_json) 
-                    successful_updates += 1                    
+                    # Leere Kompatibilitätsliste aus dem OE-Index ergänzen
+                    if self.oe_kb and self.oe_kb.complete(response_json):
+                        logger.info(f"📚 Compatibility table of product {product_id} filled from the OE knowledge base")
+                    with self.metrics.timer("render"):
+                        section = render_ai_section(response_json)
+                    parsed.append((product_id, response_json, section))
 
                 elif error_message:
+                    self.metrics.inc("items_total", outcome="failed")
                     logger.error(f"❌ Batch error for ID={product_id}: {error_message}")
-                    print(f"❌ Batch error for ID={product_id}: {error_message}")
             except Exception as e:
                 logger.error(f"💥 Critical Loop Error processing item {product_id}: {e}")
+        return parsed
+
+    #The function takes the finished parser packets (the first one, or all with ALL_COMPLETED) and hands every
+    #bulk_chunk_size results to the writers.
+    def __collect(self, pipeline, writers, return_when):
+        if not pipeline["parsing"]:
+            return
+        done, pipeline["parsing"] = wait(pipeline["parsing"], return_when=return_when)
+        for future in done:
+            try:
+                parsed = future.result()
+            except Exception as e:
+                logger.error(f"💥 Result parser failed: {e}")
+                continue
+            for product_id, response_json, section in parsed:
+                pipeline["pending"].append((product_id, response_json, section))
+                if len(pipeline["pending"]) >= bulk_chunk_size:
+                    self.__submit_write(pipeline, writers)
+
+    #The function queues the pending results for a writer thread; with 2 x apply_db_writers chunks queued it waits for one.
+    def __submit_write(self, pipeline, writers):
+        if len(pipeline["writing"]) >= 2 * apply_db_writers:
+            self.__drain_writes(pipeline, FIRST_COMPLETED)
+        pipeline["writing"].add(writers.submit(self.__flush, pipeline["pending"], pipeline["members"], pipeline["fingerprints"]))
+        pipeline["pending"] = []
+
+    def __drain_writes(self, pipeline, return_when):
+        if not pipeline["writing"]:
+            return
+        done, pipeline["writing"] = wait(pipeline["writing"], return_when=return_when)
+        for future in done:
+            try:
+                pipeline["updated"] += future.result()
+            except Exception as e:
+                logger.error(f"❌ Bulk writer failed: {e}")
+
+    #The function returns the product IDs listed in a batch error file (or any iterable of its lines).
+    def failed_product_ids(self, jsonl_lines):
+        product_ids = []
+        for data in self.parse_jsonl_results(jsonl_lines):
+            custom_id = data.get("custom_id") or ""
+            try:
+                product_ids.append(int(custom_id.split("-")[-1]))
+            except ValueError:
+                logger.error(f"❌ Unknown custom_id in error file: {custom_id}")
+        return product_ids
+
+    #The function runs in a writer thread: it writes the collected results to the database and stores them in the response cache.
+    def __flush(self, pending, group_members, fingerprints):
+        results = fan_out([(product_id, response_json) for product_id, response_json, _ in pending], group_members)
+        sections = dict(fan_out([(product_id, section) for product_id, _, section in pending], group_members))
+        written = set()
+        updated = self.opencart.UpdateItemsBulk(results, sections=sections, fingerprints=fingerprints, written=written)
+        with self.lock:
+            self.answered_ids.update(
+                product_id for product_id, _, _ in pending
+                if all(member_id in written for member_id in group_members.get(product_id, [product_id]))
+            )
+        self.metrics.inc("items_total", updated, outcome="updated")
+        self.metrics.inc("items_total", len(results) - updated, outcome="failed")
+        try:
+            self.cache.resolve_pending([(f"product-id-{product_id}", response_json) for product_id, response_json, _ in pending])
+        except Exception as e:
+            logger.error(f"❌ Response cache error: {e}")
+        if self.oe_kb:
+            self.__learn(pending, group_members)
+        return updated
+
+    #The function stores the answers in the OE knowledge base under their OE numbers and the EAN/UPC of every product
+    #they were written to — the numbers synchronous requests are looked up by (product_numbers).
+    def __learn(self, pending, group_members):
+        members = {product_id: group_members.get(product_id, [product_id]) for product_id, _, _ in pending}
+        try:
+            codes = self.opencart.fetch_codes(member_id for ids in members.values() for member_id in ids)
+        except Exception as e:
+            logger.error(f"❌ Error reading EAN/UPC for the OE knowledge base: {e}")
+            codes = {}
+        self.oe_kb.learn_many([
+            (response_json, [number for member_id in members[product_id] if member_id in codes for number in product_numbers(codes[member_id])])
+            for product_id, response_json, _ in pending
+        ])
 
-        logger.info(f"🎉 Batch results processing finished. Updated {successful_updates} products.")
\ No newline at end of file
+    def __count_usage(self, usage, chars=None):
+        if not usage:
+            return
+        input_tokens, cached_tokens, output_tokens = self.metrics.record_usage(usage, "batch")
+        # Batch-Anfragen sind Chat-Completions: sie kalibrieren die Schätzung für "chat"
+        get_token_estimator().observe("chat", input_tokens, cached_tokens, output_tokens, chars)
+        with self.lock:
+            self.token_totals["input"] += input_tokens
+            self.token_totals["cached"] += cached_tokens
+            self.token_totals["output"] += output_tokens
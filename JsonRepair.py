@@ -0,0 +1,181 @@
+import json
+import re
+from configuration.configurate_logs import setup_logger
+from ResponseSchema import RESPONSE_SCHEMA, REQUIRED_KEYS
+from Metrics import get_metrics
+
+logger = setup_logger()
+
+FENCE = re.compile(r"```(?:json|JSON)?")
+# Unvollständiges Ende nach dem Abschneiden: Komma, Schlüssel ohne Wert, halber Literal-Wert
+DANGLING_TAIL = re.compile(r'(?:,\s*|,?\s*"(?:[^"\\]|\\.)*"\s*:\s*|:\s*(?:t|tr|tru|f|fa|fal|fals|n|nu|nul|-?\d+\.?)|\\)$')
+
+class RepairFailed(ValueError):
+    pass
+
+#The function parses a model answer (text or an already decoded object) into a schema-valid dict.
+#Answers that are not valid JSON go through the local
+#repair steps (markdown fences, prose around the object, truncation) before giving up, so they do not have to be
+#requested again. Every answer is counted in json_answers_total{outcome=valid|repaired|failed}.
+def parse_model_json(text, source, schema=RESPONSE_SCHEMA, required=REQUIRED_KEYS):
+    metrics = get_metrics()
+    steps = []
+    try:
+        if isinstance(text, dict):
+            result = text
+        else:
+            try:
+                result = json.loads(text)
+            except (TypeError, ValueError):
+                result = repair_json(text, steps)
+        result = validate(coerce(result, schema, steps), schema, required)
+    except RepairFailed:
+        metrics.inc("json_answers_total", source=source, outcome="failed")
+        raise
+
+    for step in steps:
+        metrics.inc("json_repair_steps_total", source=source, step=step)
+    metrics.inc("json_answers_total", source=source, outcome="repaired" if steps else "valid")
+    if steps:
+        logger.info(f"🩹 Repaired {source} answer locally ({', '.join(steps)})")
+    return result
+
+#The function turns a damaged answer into a dict; the applied steps are appended to steps.
+def repair_json(text, steps):
+    if not isinstance(text, str) or "{" not in text:
+        raise RepairFailed("answer contains no JSON object")
+
+    if "```" in text:
+        text = FENCE.sub("", text)
+        steps.append("fences")
+
+    start = text.index("{")
+    end = _object_end(text, start)
+    if start > 0 or (end is not None and text[end:].strip()):
+        steps.append("extract")
+    if end is None:
+        text = close_truncated(text[start:])
+        steps.append("close_truncated")
+    else:
+        text = text[start:end]
+
+    try:
+        return json.loads(text)
+    except ValueError as e:
+        raise RepairFailed(f"answer is not repairable: {e}")
+
+#The function returns the index after the brace that closes the object starting at start, or None if it is truncated.
+def _object_end(text, start):
+    depth = 0
+    in_string = False
+    escape = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            if depth == 0:
+                return index + 1
+    return None
+
+#The function completes a truncated JSON text without inventing values: a half-written string is dropped together
+#with its key, an unclosed object or array inside a list (e.g. a cut-off compatibility row) is dropped as a whole,
+#then a dangling key, comma or half-written literal is removed and the missing closing brackets are appended.
+def close_truncated(text):
+    # Offene Klammern: (schließendes Zeichen, Position, Elternelement ist eine Liste)
+    stack = []
+    in_string = False
+    escape = False
+    string_start = 0
+    for index, char in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+            string_start = index
+        elif char in "{[":
+            stack.append(("}" if char == "{" else "]", index, bool(stack) and stack[-1][0] == "]"))
+        elif char in "}]" and stack:
+            stack.pop()
+
+    if in_string:
+        text = text[:string_start]
+    # Die äußerste unvollständige Zeile einer Liste fällt komplett weg
+    for depth, (_, start, in_list) in enumerate(stack):
+        if in_list:
+            text = text[:start]
+            del stack[depth:]
+            break
+
+    text = text.rstrip()
+    while True:
+        trimmed = DANGLING_TAIL.sub("", text).rstrip()
+        if trimmed == text:
+            break
+        text = trimmed
+    # Ein Schlüssel ohne Doppelpunkt am Objektende ("...", "kompatibilität")
+    if stack and stack[-1][0] == "}" and re.search(r'[{,]\s*"(?:[^"\\]|\\.)*"$', text):
+        text = re.sub(r',?\s*"(?:[^"\\]|\\.)*"$', "", text)
+    return text + "".join(closer for closer, _, _ in reversed(stack))
+
+#The function converts field values to the types declared in the schema (e.g. a list for a string field).
+def coerce(result, schema, steps):
+    if not isinstance(result, dict):
+        raise RepairFailed(f"answer is a {type(result).__name__}, not an object")
+
+    coerced = False
+    for key, expected in schema.items():
+        if key not in result or isinstance(result[key], expected):
+            continue
+        value = result[key]
+        if expected is str:
+            if isinstance(value, list):
+                value = " ".join(str(part) for part in value if part is not None)
+            else:
+                value = "" if value is None else str(value)
+        elif expected is list:
+            if value is None or value == "":
+                value = []
+            elif isinstance(value, str):
+                value = [part.strip() for part in value.split(",") if part.strip()]
+            else:
+                value = [value]
+        else:
+            continue
+        result[key] = value
+        coerced = True
+
+    # Nur nicht-leere Objekte sind Tabellenzeilen (eine abgeschnittene letzte Zeile wird zu {})
+    compatibility = result.get("kompatibilität")
+    if isinstance(compatibility, list) and not all(isinstance(row, dict) and row for row in compatibility):
+        result["kompatibilität"] = [row for row in compatibility if isinstance(row, dict) and row]
+        coerced = True
+
+    if coerced:
+        steps.append("coerce_types")
+    return result
+
+#The function checks the required keys and the value types; raises RepairFailed if the answer is unusable.
+def validate(result, schema, required):
+    missing = [key for key in required if result.get(key) in (None, "")]
+    if missing:
+        raise RepairFailed(f"missing keys {missing}")
+    wrong = [key for key, expected in schema.items() if key in result and not isinstance(result[key], expected)]
+    if wrong:
+        raise RepairFailed(f"wrong value types for {wrong}")
+    return result
@@ -1,21 +1,61 @@
-import json
+import itertools
 import sys
 import time
+from functools import cached_property
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from ChatgptAiManager import ChatgptAiManager
 from BatchModule import BatchModule
-from OpenCartModul import OpencartProductController
+from OpenCartModul import OpencartProductController, input_fingerprint, close_pool
 from JsonParser import JsonParser
-from configuration.configurate_logs import setup_logger
+from RateLimiter import RateLimiter
+from Metrics import get_metrics
+from RetryPolicy import get_retry_engine
+from TokenEstimator import get_token_estimator
+from BatchRegistry import BatchRegistry, BatchPoller
+from ProductGrouper import group_items, group_members, fan_out
+from OeKnowledgeBase import product_numbers
+from configuration.config import sync_workers, rate_limit_rpm, rate_limit_tpm, batch_wait_minutes
+from configuration.config import fetch_page_size, batch_max_resubmits, batch_enqueued_token_limit
+from configuration.config import lease_enabled, lease_sync_seconds, lease_batch_seconds, fingerprint_enabled
+from configuration.config import hybrid_fresh_hours, hybrid_max_sync_items, hybrid_min_batch_size, hybrid_promote_after_hours
+from configuration.config import hybrid_cancel_wait_minutes
+from configuration.configurate_logs import setup_logger, log_payload
 from configuration.print_help import print_help
 
 logger = setup_logger()
 
 class MainController:
     def __init__(self):
-        self.ai = ChatgptAiManager()
-        self.opencart = OpencartProductController()
-        self.ai_batch = BatchModule()
-        self.json_parser = JsonParser()
+        self.metrics = get_metrics()
+        self.retry_engine = get_retry_engine()
+        self.estimator = get_token_estimator()
+
+    # Die Komponenten werden erst beim ersten Zugriff gebaut: eine Statusabfrage (batch_id=, poll=)
+    # erzeugt keinen Synchron-Client, und alle teilen sich einen OpenAI-Client und einen DB-Pool.
+    @cached_property
+    def ai(self):
+        return ChatgptAiManager()
+
+    @cached_property
+    def opencart(self):
+        return OpencartProductController()
+
+    @cached_property
+    def ai_batch(self):
+        return BatchModule()
+
+    @cached_property
+    def json_parser(self):
+        return JsonParser(self.opencart)
+
+    @cached_property
+    def batch_registry(self):
+        return BatchRegistry()
+
+    @cached_property
+    def batch_poller(self):
+        return BatchPoller(self.ai_batch, self.batch_registry, self.process_finished_batch_results,
+                           on_failed=lambda batch_id: self.__resubmit_failed(batch_id, self.batch_registry.group_members(batch_id)))
 
     def send_to_chatgpt(self, name, full_prompt):
         #response = self.ai.generate_description(product_name=name, prompt_text=full_prompt)
@@ -25,34 +65,132 @@ class MainController:
             logger.warning(f"⚠️ ChatGPT's response is raw: {response}")
             return None
 
-        formatted_json = json.dumps(response, ensure_ascii=False, indent=4)
-        logger.info(f"📤 ChatGPT's response to '{name}':\n{formatted_json}")
+        log_payload(logger, f"📤 ChatGPT's response to '{name}'", response)
         return response
     
-    #The function processes the list of products synchronously — that is, one by one.
-    def process_synchronously(self, items, full_prompt):
-        logger.info(f"🔄 Running in SYNCHRONOUS mode. Processing {len(items)} items.")
+    #The function processes the list (or stream) of products synchronously — that is, one by one.
+    #fingerprints maps product IDs to the input fingerprint stored with their description.
+    def process_synchronously(self, items, full_prompt, fingerprints=None):
+        fingerprints = fingerprints or {}
+        logger.info("🔄 Running in SYNCHRONOUS mode.")
 
         if not full_prompt:
             logger.error("❌ Cannot process: Prompt not loaded.")
             return
         
         for item in items:
+            if not self.__renew_leases([item]):
+                continue
             product_id = item["product_id"]
-            name = self.ai_batch.PrepareRequestContent(item, full_prompt)            
+            with self.metrics.timer("prompt_prep"):
+                instructions, name = self.ai_batch.PrepareRequestMessages(item, full_prompt)
             logger.info(f"➡️ Requesting synchronous completion for ID={product_id}")
 
             try:
                 #response_json = self.ai.generate_description(product_name=product_name, prompt_text=full_prompt)
-                response_json = self.ai.call_itemdesc_with_browsing(prompt_text=name) 
-                self.opencart.UpdateItemDescAndSeo(product_id, response_json)               
-                logger.info(f"✅ Successfully updated product ID={product_id}")
+                response_json = self.retry_engine.call(self.ai.call_itemdesc_with_browsing, prompt_text=name, instructions=instructions,
+                                                       oe_numbers=product_numbers(item))
+                for member_id in item.get("group_product_ids", [product_id]):
+                    self.opencart.UpdateItemDescAndSeo(member_id, response_json, fingerprints.get(member_id))
+                    logger.info(f"✅ Successfully updated product ID={member_id}")
+                self.metrics.inc("items_total", len(item.get("group_product_ids", [product_id])), outcome="updated")
 
             except Exception as e:
+                self.metrics.inc("items_total", outcome="failed")
                 logger.error(f"❌ Critical failure during synchronous processing for ID={product_id}: {e}")
-                time.sleep(1)
 
-    #The function gets the batch processing results by batch_id, loads them and updates the database
+    #The function processes the list (or stream) of products concurrently with a bounded worker pool sharing one RPM/TPM rate limiter.
+    #At most 2 x workers items are in flight, so a streamed backlog is consumed with constant memory; their leases are
+    #renewed per dispatch window, not only when the page was fetched.
+    #All database writes go through a single writer thread, so updates stay ordered per product.
+    def process_concurrently(self, items, full_prompt, workers=None, fingerprints=None):
+        workers = workers or sync_workers
+        fingerprints = fingerprints or {}
+        logger.info(f"🔄 Running in CONCURRENT SYNCHRONOUS mode with {workers} workers.")
+
+        if not full_prompt:
+            logger.error("❌ Cannot process: Prompt not loaded.")
+            return
+
+        limiter = RateLimiter(rate_limit_rpm, rate_limit_tpm)
+        successful_updates = 0
+        processed = 0
+        in_flight = {}
+
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer") as db_writer, \
+             ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sync-worker") as pool:
+            items = iter(items)
+            while True:
+                window = list(itertools.islice(items, max(2 * workers - len(in_flight), 0)))
+                for item in self.__renew_leases(window):
+                    future = pool.submit(self.__process_item_limited, item, full_prompt, limiter, db_writer, fingerprints)
+                    in_flight[future] = item["product_id"]
+
+                if not in_flight:
+                    if window:
+                        continue
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    product_id = in_flight.pop(future)
+                    processed += 1
+                    try:
+                        if future.result():
+                            successful_updates += 1
+                        else:
+                            self.metrics.inc("items_total", outcome="failed")
+                    except Exception as e:
+                        self.metrics.inc("items_total", outcome="failed")
+                        logger.error(f"❌ Critical failure during synchronous processing for ID={product_id}: {e}")
+
+        logger.info(f"🎉 Concurrent processing finished. Updated {successful_updates} of {processed} requests.")
+
+    #The function renews the leases of the items (and their group members) right before they are requested: a page is
+    #leased when it is fetched, and its tail may wait longer than lease_sync_seconds for a free worker. Returns the items
+    #this worker still holds; members taken over by another worker in the meantime are left to that worker.
+    def __renew_leases(self, items):
+        if not lease_enabled or not items:
+            return items
+        claimed = self.opencart.claim_ids(
+            [member_id for item in items for member_id in item.get("group_product_ids", [item["product_id"]])], lease_sync_seconds
+        )
+        held = []
+        for item in items:
+            member_ids = [member_id for member_id in item.get("group_product_ids", [item["product_id"]]) if member_id in claimed]
+            if not member_ids:
+                continue
+            if "group_product_ids" in item:
+                item["group_product_ids"] = member_ids
+            held.append(item)
+        return held
+
+    #The function runs one product through the rate limiter and the API. Failures are retried by the retry engine
+    #according to their error class; 429 responses throttle the shared rate limiter instead of sleeping per worker.
+    def __process_item_limited(self, item, full_prompt, limiter, db_writer, fingerprints):
+        product_id = item["product_id"]
+        with self.metrics.timer("prompt_prep"):
+            instructions, content = self.ai_batch.PrepareRequestMessages(item, full_prompt)
+        # Das TPM-Limit des Anbieters rechnet mit der maximalen Ausgabe
+        estimated_tokens = self.estimator.input_tokens(instructions, content, api="responses") + self.ai.max_output_tokens
+
+        def before_attempt():
+            limiter.acquire(estimated_tokens)
+            logger.info(f"➡️ Requesting synchronous completion for ID={product_id}")
+
+        response_json = self.retry_engine.call(
+            self.ai.call_itemdesc_with_browsing, prompt_text=content, instructions=instructions, oe_numbers=product_numbers(item),
+            before_attempt=before_attempt, on_rate_limited=limiter.on_rate_limited, on_success=limiter.on_success
+        )
+
+        for member_id in item.get("group_product_ids", [product_id]):
+            db_writer.submit(self.opencart.UpdateItemDescAndSeo, member_id, response_json, fingerprints.get(member_id)).result()
+            logger.info(f"✅ Successfully updated product ID={member_id}")
+        self.metrics.inc("items_total", len(item.get("group_product_ids", [product_id])), outcome="updated")
+        return True
+
+    #The function gets the batch processing results by batch_id, loads them and updates the database.
+    #Returns True when the results were applied.
     def process_finished_batch_results(self, batch_id):
         logger.info(f"🔄 Starting retrieval of results for Batch ID: {batch_id}")
         try:
@@ -61,69 +199,358 @@ class MainController:
             
             if error_message:
                 logger.error(f"❌ Failed to process batch {batch_id}: {error_message}")
-                return
-                
-            jsonl_results_text = self.ai_batch.retrieve_results(output_file_id)
+                return False
 
-            if jsonl_results_text:
-                self.json_parser.process_batch_results(jsonl_results_text)
+            members = self.batch_registry.group_members(batch_id)
+            self.json_parser.answered_ids = set()
+            if output_file_id:
+                # Ergebnisse werden während des Downloads zeilenweise angewendet
+                results_stream = self.ai_batch.stream_results(output_file_id)
+                self.json_parser.process_batch_results(results_stream, members, self.batch_registry.fingerprints(batch_id))
                 logger.info("Batch results processed and database updated.")
-            else:
-                logger.error(f"❌ Could not retrieve JSONL content for batch {batch_id}.")
+
+            error_file_id = getattr(final_job, "error_file_id", None)
+            if error_file_id:
+                failed_ids = self.json_parser.failed_product_ids(self.ai_batch.stream_results(error_file_id))
+                self.metrics.inc("items_total", len(failed_ids), outcome="failed")
+                logger.warning(f"⚠️ Batch {batch_id}: {len(failed_ids)} request(s) failed (error file {error_file_id})")
+
+            # Fehlgeschlagene, unbrauchbare und (bei 'expired') nie bearbeitete Anfragen gehen in einen Folge-Batch,
+            # bei einem abgebrochenen (promoted) Batch in den synchronen Pfad
+            unanswered = {product_id: ids for product_id, ids in members.items() if product_id not in self.json_parser.answered_ids}
+            row = self.batch_registry.get(batch_id)
+            if unanswered and row and row["promoted"]:
+                self.__run_promoted(batch_id, unanswered)
+            elif unanswered and final_job.status != 'cancelled':
+                self.__resubmit_failed(batch_id, unanswered)
+            return True
                             
         except Exception as e:
             logger.error(f"❌ Critical failure during batch result processing for ID={batch_id}: {e}")
+            return False
+
+    #The function submits the requests of the given product IDs ({requested id: group member ids}) again as a follow-up batch,
+    #built from the original input file. A chain of follow-ups stops after batch_max_resubmits generations.
+    def __resubmit_failed(self, batch_id, members):
+        row = self.batch_registry.get(batch_id)
+        if not row or not members:
+            return
+        generation = row["generation"] + 1
+        if generation > batch_max_resubmits:
+            logger.error(f"❌ Batch {batch_id}: {len(members)} item(s) still failed after {row['generation']} resubmission(s), giving up.")
+            return
+
+        input_file_path, product_ids = self.ai_batch.create_followup_file(row["input_file"], members, generation)
+        if not input_file_path:
+            return
+        for _, batch_job in self.ai_batch.submit_batch_jobs([input_file_path]):
+            self.batch_registry.register(batch_job, product_ids, input_file_path, members, parent_batch_id=batch_id, generation=generation,
+                                         est_tokens=self.ai_batch.shard_tokens.get(input_file_path),
+                                         fingerprints=self.batch_registry.fingerprints(batch_id))
+            # Die Lease des ursprünglichen Batches läuft nach lease_batch_seconds ab, der Folge-Batch braucht bis zu 24h mehr
+            self.opencart.extend_leases([member_id for product_id in product_ids for member_id in members.get(product_id, [product_id])],
+                                        lease_batch_seconds)
+            self.metrics.inc("batch_resubmits_total")
+            logger.info(f"🔁 Resubmitted {len(product_ids)} failed item(s) of {batch_id} as batch {batch_job.id} (generation {generation})")
+
+    #The function processes the unanswered items ({requested id: group member ids}) of a promoted batch synchronously.
+    def __run_promoted(self, batch_id, members):
+        product_ids = [member_id for ids in members.values() for member_id in ids]
+        # Die Leases gehören dem Prozess, der den Batch eingereicht hat
+        self.opencart.release_leases(product_ids)
+        items = self.opencart.fetch_products_by_ids(product_ids)
+        prompt_text = self.opencart.fetch_prompt()
+        if not items or not prompt_text:
+            return
+        self.metrics.inc("items_promoted_total", len(items))
+        logger.info(f"⏫ {len(items)} unanswered item(s) of cancelled batch {batch_id} → synchronous path")
+        self.__run_sync(items, prompt_text)
 
     #The process_all function receives products by limit or pid and processes them one by one
-    def process_all(self, mode, limit=None, pid=None, batch_id_to_monitor=None):
+    #Stage timings, tokens, retries and item counts of the run are exported as Prometheus textfile and JSON summary at the end.
+    #incremental=True also re-requests processed products whose fingerprint (name/EAN/UPC + prompt) changed.
+    def process_all(self, mode, limit=None, pid=None, batch_id_to_monitor=None, workers=None, poll_minutes=None, incremental=False):
+        try:
+            self.__process_all(mode, limit, pid, batch_id_to_monitor, workers, poll_minutes, incremental)
+        finally:
+            self.metrics.report()
+            self.metrics.export()
+            self.estimator.save()
+            close_pool()
+
+    def __process_all(self, mode, limit, pid, batch_id_to_monitor, workers, poll_minutes, incremental):
         logger.info("Start of goods processing")
 
+        # Ohne die Lease-Spalten schlägt jede Backlog-Abfrage und jedes Schreiben fehl
+        if lease_enabled and not self.opencart.has_columns("chatgpt_lease_owner", "chatgpt_lease_until"):
+            logger.error("❌ lease_enabled needs the chatgpt_lease_owner/chatgpt_lease_until columns: run sql/leases.sql "
+                         "or set lease_enabled = False in configuration/config.py.")
+            return
+
         if batch_id_to_monitor:
-            self.process_finished_batch_results(batch_id_to_monitor)
+            if self.process_finished_batch_results(batch_id_to_monitor) and self.batch_registry.get(batch_id_to_monitor):
+                self.batch_registry.mark_applied(batch_id_to_monitor)
             logger.info("Finishing processing after monitor.")
             return
+
+        if poll_minutes is not None:
+            self.batch_poller.run(max_wait_seconds=poll_minutes * 60)
+            logger.info("Finishing processing after poll.")
+            return
         
+        if mode not in (0, 1, 2):
+            logger.error(f"❌ Unknown mode: {mode}. Use 0 (Synchronous), 1 (Batch) or 2 (Hybrid).")
+            return
+
         if limit is None and pid is None:
             limit = 3
             logger.info("ℹ️ No parameters provided — using default limit=3")
 
-        items, prompt_text  = self.opencart.fetch_products_and_prompt(limit=limit, pid=pid)
+        if incremental and not fingerprint_enabled:
+            logger.error("❌ incremental=1 needs the chatgpt_fingerprint column: run sql/fingerprint.sql and set fingerprint_enabled = True.")
+            return
+
+        if incremental:
+            logger.info("🔁 Incremental run: also selecting products whose name/EAN/UPC or prompt changed.")
+            self.opencart.incremental = True
+
+        if mode == 2 and pid is not None:
+            # Eine einzelne angeforderte ID ist immer dringend
+            logger.info("⚡ Hybrid mode: pid= request goes through the synchronous path.")
+            mode = 0
+
+        if mode == 2:
+            self.__process_hybrid(limit, workers)
+            self.ai.cache.report()
+            if self.ai.oe_kb:
+                self.ai.oe_kb.report()
+            logger.info("Finishing processing.")
+            return
 
-        if not items:
+        if pid is not None:
+            items, prompt_text = self.opencart.fetch_products_and_prompt(pid=pid)
+        else:
+            # count=0 verarbeitet den gesamten Rückstand seitenweise
+            # Batch-Artikel bleiben bis zur Übernahme der Ergebnisse (bis zu 24h) für diesen Worker reserviert
+            items = self.opencart.iter_products(limit=limit or None, lease_seconds=lease_batch_seconds if mode == 1 else lease_sync_seconds)
+            prompt_text = self.opencart.fetch_prompt()
+
+        items = iter(items)
+        first_item = next(items, None)
+        if first_item is None:
             if pid:
                 logger.error(f"❌ Product with ID={pid} not found or already processed")
             else:
                 logger.warning("⚠️ There are no products to process")
             return
+        items = itertools.chain([first_item], items)
         
         if not prompt_text:
             logger.error("❌ Prompt is empty or not found!")
             return
-        
+
         if mode == 1:
             final_limit = limit if limit else (1 if pid else None)
             logger.info(f"🔄 Running in BATCH SUBMISSION mode (limit={final_limit}).")
-            input_file_path = self.ai_batch.create_input_file(items, prompt_text)
-            batch_job = self.ai_batch.submit_batch_job(input_file_path)
-            
-            logger.info(f"✨ To monitor status, run: python MainController.py batch_id={batch_job.id}")
-            result = self.ai_batch.WaitForTaskFinished(batch_job.id, 20)
-            if result == 1:
-                self.process_finished_batch_results(batch_job.id)
-                logger.info("Finishing processing after monitor.")
+            self.__run_batch(items, prompt_text)
+        else:
+            self.__run_sync(items, prompt_text, workers, single=pid is not None)
+
+        self.ai.cache.report()
+        if self.ai.oe_kb:
+            self.ai.oe_kb.report()
+        logger.info("Finishing processing.")
+
+    #The function answers cached items and sends the rest through the (concurrent) synchronous path.
+    def __run_sync(self, items, prompt_text, workers=None, single=False):
+        cache_key_for = lambda item: self.ai.cache_key(*self.ai_batch.PrepareRequestMessages(item, prompt_text))
+        fingerprints = {}
+        items = self.__prepare_items(items, prompt_text, cache_key_for, {}, fingerprints,
+                                     forecast=lambda page: self.__forecast_sync(page, prompt_text))
+
+        workers = workers or sync_workers
+        if workers > 1 and not single:
+            self.process_concurrently(items, prompt_text, workers, fingerprints)
+        else:
+            self.process_synchronously(items, prompt_text, fingerprints)
+
+    #The function answers cached items, submits the rest as sharded batch jobs and waits up to batch_wait_minutes for them.
+    def __run_batch(self, items, prompt_text):
+        cache_key_for = lambda item: self.ai_batch.cache_key(*self.ai_batch.PrepareRequestMessages(item, prompt_text))
+        members = {}
+        fingerprints = {}
+        items = self.__prepare_items(items, prompt_text, cache_key_for, members, fingerprints)
+
+        shards = self.ai_batch.create_input_files(items, prompt_text)
+        if not shards:
+            logger.info("✅ All items were answered from the response cache.")
+        shards = self.__within_token_budget(shards, members)
+        batch_jobs = self.ai_batch.submit_batch_jobs(shards) if shards else []
         
-        elif mode == 0:
-            self.process_synchronously(items, prompt_text)
+        for input_file_path, batch_job in batch_jobs:
+            self.batch_registry.register(batch_job, shards[input_file_path], input_file_path, members,
+                                         est_tokens=self.ai_batch.shard_tokens.get(input_file_path), fingerprints=fingerprints)
+            logger.info(f"✨ To monitor status, run: python MainController.py batch_id={batch_job.id}")
+
+        if batch_jobs:
+            logger.info("✨ Open batches are also picked up by: python MainController.py poll=0")
+            # Jeder Shard wird verarbeitet, sobald er fertig ist
+            self.batch_poller.run(max_wait_seconds=batch_wait_minutes * 60, batch_ids=[job.id for _, job in batch_jobs])
+            logger.info("Finishing processing after monitor.")
+
+    #The function logs the cost/time forecast for the next page of synchronous requests.
+    def __forecast_sync(self, page, prompt_text):
+        input_tokens = sum(
+            self.estimator.input_tokens(*self.ai_batch.PrepareRequestMessages(item, prompt_text), api="responses") for item in page
+        )
+        output_tokens = len(page) * self.estimator.output_tokens(self.ai.max_output_tokens, api="responses")
+        self.estimator.forecast("sync page", self.ai.model, len(page), input_tokens, output_tokens,
+                                max_output_tokens=self.ai.max_output_tokens, api="responses")
+
+    #The function logs the forecast for the batch shards and keeps only as many shards as fit below the organization's
+    #enqueued-token limit, counting the batches that are still queued. Deferred shards are not uploaded; their leases
+    #are released, so the items are picked up again by the next run.
+    def __within_token_budget(self, shards, members):
+        if not shards:
+            return shards
+        requests = sum(len(product_ids) for product_ids in shards.values())
+        input_tokens = sum(self.ai_batch.shard_tokens.get(path, 0) for path in shards)
+        self.estimator.forecast("batch", self.ai_batch.model, requests, input_tokens,
+                                requests * self.estimator.output_tokens(self.ai.max_output_tokens), batch=True)
+
+        available = batch_enqueued_token_limit - self.batch_registry.enqueued_tokens()
+        accepted, deferred = {}, {}
+        for path, product_ids in shards.items():
+            tokens = self.ai_batch.shard_tokens.get(path, 0)
+            if tokens <= available:
+                accepted[path] = product_ids
+                available -= tokens
+            else:
+                deferred[path] = product_ids
+
+        if deferred:
+            deferred_ids = [member_id for product_ids in deferred.values() for product_id in product_ids
+                            for member_id in members.get(product_id, [product_id])]
+            deferred_tokens = sum(self.ai_batch.shard_tokens.get(path, 0) for path in deferred)
+            logger.warning(f"⏸️ {len(deferred)} shard(s) with {len(deferred_ids)} item(s) (~{deferred_tokens} tokens) exceed the "
+                           f"enqueued-token limit of {batch_enqueued_token_limit}; deferred to the next run")
+            self.opencart.release_leases(deferred_ids)
+        return accepted
+
+    #The function routes every item by urgency and queue depth (mode=2): unanswered items of batches stuck beyond
+    #hybrid_promote_after_hours and listings added within hybrid_fresh_hours go through the synchronous path first,
+    #the remaining backlog goes into batches — unless fewer than hybrid_min_batch_size items are left.
+    #Items that are already part of an open batch are never requested twice. limit (count=) caps both routes together.
+    def __process_hybrid(self, limit, workers):
+        logger.info(f"🔀 Running in HYBRID mode (limit={limit or None}).")
+        prompt_text = self.opencart.fetch_prompt()
+        if not prompt_text:
+            logger.error("❌ Prompt is empty or not found!")
+            return
+
+        self.__promote_stuck_batches()
+        open_ids = self.batch_registry.open_item_ids()
+
+        fresh_limit = min(limit, hybrid_max_sync_items) if limit else hybrid_max_sync_items
+        fresh = [
+            item for item in self.opencart.fetch_fresh_products(hybrid_fresh_hours, fresh_limit)
+            if item["product_id"] not in open_ids
+        ]
+        if fresh:
+            logger.info(f"⚡ {len(fresh)} fresh item(s) → synchronous path")
+            self.metrics.inc("items_routed_total", len(fresh), route="sync")
+            self.__run_sync(fresh, prompt_text, workers)
+
+        if limit and len(fresh) >= limit:
+            logger.info(f"ℹ️ Limit of {limit} item(s) reached by fresh items, backlog left for the next run.")
+            return
 
+        # Erfolgreich synchron beschriebene Artikel sind nicht mehr im Rückstand (chatgpt_state gesetzt)
+        backlog = (
+            item for item in self.opencart.iter_products(limit=limit - len(fresh) if limit else None, lease_seconds=lease_batch_seconds)
+            if item["product_id"] not in open_ids
+        )
+        head = list(itertools.islice(backlog, hybrid_min_batch_size))
+        if not head:
+            logger.info("✅ No backlog left for batch processing.")
+        elif len(head) < hybrid_min_batch_size:
+            logger.info(f"⚡ Only {len(head)} backlog item(s) left (< {hybrid_min_batch_size}) → synchronous path")
+            self.metrics.inc("items_routed_total", len(head), route="sync")
+            self.__run_sync(head, prompt_text, workers)
         else:
-            logger.error(f"❌ Unknown mode: {mode}. Use 0 (Synchronous) or 1 (Batch).")
-        logger.info("Finishing processing.")
+            logger.info("📦 Backlog → batch path")
+            self.__run_batch(self.__count_routed(itertools.chain(head, backlog), "batch"), prompt_text)
+
+    def __count_routed(self, items, route):
+        for item in items:
+            self.metrics.inc("items_routed_total", route=route)
+            yield item
+
+    #The function cancels batches that are still in progress after hybrid_promote_after_hours. They stay open in the registry
+    #until the provider reports 'cancelled'; then the answers finished so far are applied at batch price and only the
+    #unanswered items are processed synchronously (__run_promoted). It waits up to hybrid_cancel_wait_minutes for that;
+    #batches that take longer are finished by the next poll run.
+    def __promote_stuck_batches(self):
+        deadline = time.time() - hybrid_promote_after_hours * 3600
+        promoted = []
+        for row in self.batch_registry.open_batches():
+            # Fast fertige Batches (finalizing) und bereits beendete nicht abbrechen
+            if row["created_at"] > deadline or row["state"] not in ("validating", "in_progress"):
+                continue
+            batch_job = self.ai_batch.cancel_batch(row["batch_id"])
+            if not batch_job:
+                continue
+            self.batch_registry.update_status(row["batch_id"], batch_job.status)
+            self.batch_registry.mark_promoted(row["batch_id"])
+            promoted.append(row["batch_id"])
+            hours = (time.time() - row["created_at"]) / 3600
+            logger.warning(f"⏫ Batch {row['batch_id']} still {row['state']} after {hours:.1f}h — cancelling, "
+                           f"its unanswered items will be promoted to the synchronous path")
+        if promoted:
+            self.batch_poller.run(max_wait_seconds=hybrid_cancel_wait_minutes * 60, batch_ids=promoted)
+
+    #The function groups duplicates and answers cached items page by page, yielding only the items that still need an API call.
+    #members collects the group membership of every yielded item and fingerprints the input fingerprint of every product,
+    #taken before the request is built; forecast(page) is called for every page that needs the API.
+    def __prepare_items(self, items, prompt_text, cache_key_for, members, fingerprints, forecast=None):
+        items = iter(items)
+        while True:
+            page = list(itertools.islice(items, fetch_page_size))
+            if not page:
+                return
+            fingerprints.update({item["product_id"]: input_fingerprint(item, prompt_text) for item in page})
+            groups = group_items(page)
+            members.update(group_members(groups))
+            remaining = self.__apply_cached(groups, cache_key_for, fingerprints)
+            if forecast and remaining:
+                forecast(remaining)
+            yield from remaining
+
+    #The function applies cached responses directly to the database and returns the items that still need an API call.
+    def __apply_cached(self, items, cache_key_for, fingerprints):
+        remaining = []
+        cached_results = []
+        for item in items:
+            response_json = self.ai.cache.get(cache_key_for(item))
+            if response_json is None:
+                remaining.append(item)
+            else:
+                cached_results.append((item["product_id"], response_json))
+
+        if cached_results:
+            logger.info(f"🗄️ {len(cached_results)} item(s) answered from the response cache, skipping the API.")
+            updated = self.opencart.UpdateItemsBulk(fan_out(cached_results, group_members(items)), fingerprints=fingerprints)
+            self.metrics.inc("items_total", updated, outcome="cached")
+        return remaining
 
 if __name__ == "__main__":
     limit = None
     pid = None
     mode = None
     batch_id_to_monitor = None
+    workers = None
+    poll_minutes = None
+    incremental = False
 
     help_flags = ['-h', '--help', 'h=1']
     if any(arg in sys.argv[1:] for arg in help_flags):
@@ -136,7 +563,7 @@ if __name__ == "__main__":
             try:
                 mode = int(arg.split("=")[1])
             except ValueError:
-                logger.error("❌ Error: mode must be 0 or 1")
+                logger.error("❌ Error: mode must be 0, 1 or 2")
                 sys.exit(1)
         elif arg.startswith("pid="):
             try:
@@ -152,8 +579,22 @@ if __name__ == "__main__":
                 sys.exit(1)
         elif arg.startswith("batch_id="):
             batch_id_to_monitor = arg.split("=")[1]
+        elif arg.startswith("poll="):
+            try:
+                poll_minutes = int(arg.split("=")[1])
+            except ValueError:
+                logger.error("❌ Error: poll must be a number of minutes")
+                sys.exit(1)
+        elif arg.startswith("incremental="):
+            incremental = arg.split("=")[1] in ("1", "true", "yes")
+        elif arg.startswith("workers="):
+            try:
+                workers = int(arg.split("=")[1])
+            except ValueError:
+                logger.error("❌ Error: workers must be a number")
+                sys.exit(1)
 
     controller = MainController()
 
-    if mode is not None or batch_id_to_monitor is not None:
-        controller.process_all(mode=mode, limit=limit, pid=pid, batch_id_to_monitor=batch_id_to_monitor)
\ No newline at end of file
+    if mode is not None or batch_id_to_monitor is not None or poll_minutes is not None:
+        controller.process_all(mode=mode, limit=limit, pid=pid, batch_id_to_monitor=batch_id_to_monitor, workers=workers, poll_minutes=poll_minutes, incremental=incremental)
\ No newline at end of file
@@ -0,0 +1,196 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from configuration.configurate_logs import setup_logger
+from configuration.config import metrics_prefix, metrics_textfile_path, metrics_summary_dir
+
+logger = setup_logger()
+
+# Obergrenzen der Latenz-Buckets in Sekunden (OpenAI-Aufrufe mit Web-Suche dauern oft > 30 s)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+HELP = {
+    "stage_seconds": ("histogram", "Wall time per pipeline stage"),
+    "db_roundtrips_total": ("counter", "SQL statements sent to MySQL"),
+    "tokens_total": ("counter", "Tokens reported in response.usage"),
+    "api_requests_total": ("counter", "OpenAI requests by API and outcome"),
+    "retries_total": ("counter", "Retried OpenAI requests by error class"),
+    "circuit_breaker_open_total": ("counter", "Times the circuit breaker opened"),
+    "batch_resubmits_total": ("counter", "Follow-up batches submitted for failed items"),
+    "stream_aborts_total": ("counter", "Streamed answers cancelled on a schema violation"),
+    "json_answers_total": ("counter", "Model answers by parse outcome (valid, repaired, failed)"),
+    "json_repair_steps_total": ("counter", "Local JSON repair steps applied"),
+    "batch_download_bytes_total": ("counter", "Bytes of batch output downloaded"),
+    "items_total": ("counter", "Products by outcome"),
+    "descriptions_unchanged_total": ("counter", "Descriptions not written because the rendered output was identical"),
+    "lease_conflicts_total": ("counter", "Products skipped because another worker holds their lease"),
+    "items_routed_total": ("counter", "Products routed by the hybrid mode (sync or batch)"),
+    "items_promoted_total": ("counter", "Products moved from a stuck batch to the sync path"),
+    "oe_kb_lookups_total": ("counter", "OE knowledge base lookups by outcome (hit, miss)"),
+}
+
+class Metrics:
+    def __init__(self, prefix=metrics_prefix, buckets=LATENCY_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.started_at = time.time()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram["buckets"][index] += 1
+                    break
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    #The context manager records the wall time of the enclosed block as stage_seconds{stage=...}.
+    @contextmanager
+    def timer(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("stage_seconds", time.perf_counter() - started, stage=stage)
+
+    #The function counts input, cached and output tokens of a Responses / Chat Completions usage (object or dict)
+    #and returns them as a tuple.
+    def record_usage(self, usage, api):
+        if usage is None:
+            return 0, 0, 0
+        get = usage.get if isinstance(usage, dict) else lambda name: getattr(usage, name, None)
+        input_tokens = get("input_tokens") or get("prompt_tokens") or 0
+        output_tokens = get("output_tokens") or get("completion_tokens") or 0
+        details = get("input_tokens_details") or get("prompt_tokens_details")
+        if isinstance(details, dict):
+            cached_tokens = details.get("cached_tokens") or 0
+        else:
+            cached_tokens = getattr(details, "cached_tokens", 0) or 0
+
+        self.inc("tokens_total", input_tokens, api=api, kind="input")
+        self.inc("tokens_total", cached_tokens, api=api, kind="cached")
+        self.inc("tokens_total", output_tokens, api=api, kind="output")
+        return input_tokens, cached_tokens, output_tokens
+
+    #The function returns all counters and histograms as plain data for the JSON summary.
+    def snapshot(self):
+        with self.lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in self.counters.items()]
+            histograms = [
+                {"name": name, "labels": dict(labels), "count": h["count"], "sum": h["sum"],
+                 "buckets": dict(zip(map(str, self.buckets), h["buckets"]))}
+                for (name, labels), h in self.histograms.items()
+            ]
+        return {
+            "started_at": self.started_at,
+            "finished_at": time.time(),
+            "duration_seconds": time.time() - self.started_at,
+            "counters": sorted(counters, key=lambda c: (c["name"], sorted(c["labels"].items()))),
+            "histograms": sorted(histograms, key=lambda h: (h["name"], sorted(h["labels"].items()))),
+        }
+
+    #The function renders the metrics in the Prometheus text exposition format.
+    def render_prometheus(self):
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+
+        lines = []
+        described = set()
+        for (name, labels), value in counters:
+            lines += self.__describe(name, described)
+            lines.append(f"{self.prefix}_{name}{self.__labels(labels)} {value}")
+        for (name, labels), h in histograms:
+            lines += self.__describe(name, described)
+            cumulative = 0
+            for bound, count in zip(self.buckets, h["buckets"]):
+                cumulative += count
+                lines.append(f"{self.prefix}_{name}_bucket{self.__labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{self.prefix}_{name}_bucket{self.__labels(labels + (('le', '+Inf'),))} {h['count']}")
+            lines.append(f"{self.prefix}_{name}_sum{self.__labels(labels)} {h['sum']:.6f}")
+            lines.append(f"{self.prefix}_{name}_count{self.__labels(labels)} {h['count']}")
+        lines.append(f"{self.prefix}_last_run_timestamp_seconds {time.time():.0f}")
+        return "\n".join(lines) + "\n"
+
+    #The function writes the Prometheus textfile (for the node_exporter textfile collector) and a per-run JSON summary.
+    #The textfile is replaced atomically, so the collector never reads a half-written file.
+    def export(self, textfile_path=metrics_textfile_path, summary_dir=metrics_summary_dir):
+        try:
+            for directory in {os.path.dirname(textfile_path), summary_dir}:
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+
+            temp_path = textfile_path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(self.render_prometheus())
+            os.replace(temp_path, textfile_path)
+
+            summary_path = os.path.join(summary_dir, f"run_{time.strftime('%Y%m%d_%H%M%S', time.localtime(self.started_at))}.json")
+            with open(summary_path, "w", encoding="utf-8") as f:
+                json.dump(self.snapshot(), f, indent=2)
+
+            logger.info(f"📈 Metrics written to {textfile_path} and {summary_path}")
+            return summary_path
+        except Exception as e:
+            logger.error(f"❌ Metrics export error: {e}")
+            return None
+
+    #The function logs a short per-stage overview of the run.
+    def report(self):
+        with self.lock:
+            stages = [(dict(labels).get("stage"), h) for (name, labels), h in self.histograms.items() if name == "stage_seconds"]
+        for stage, h in sorted(stages, key=lambda s: -s[1]["sum"]):
+            logger.info(f"⏱️ {stage}: {h['count']} call(s), {h['sum']:.2f}s total, {h['sum'] / h['count'] * 1000:.1f}ms avg")
+
+        answers = {}
+        with self.lock:
+            for (name, labels), value in self.counters.items():
+                if name == "json_answers_total":
+                    outcome = dict(labels)["outcome"]
+                    answers[outcome] = answers.get(outcome, 0) + value
+        if answers:
+            total = sum(answers.values())
+            logger.info(f"🩹 JSON answers: {answers.get('valid', 0)} valid, {answers.get('repaired', 0)} repaired, "
+                        f"{answers.get('failed', 0)} failed (repair rate {answers.get('repaired', 0) / total:.1%})")
+
+    def __describe(self, name, described):
+        if name in described or name not in HELP:
+            return []
+        described.add(name)
+        kind, text = HELP[name]
+        return [f"# HELP {self.prefix}_{name} {text}", f"# TYPE {self.prefix}_{name} {kind}"]
+
+    @staticmethod
+    def __labels(labels):
+        if not labels:
+            return ""
+        parts = []
+        for key, value in labels:
+            value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            parts.append(f'{key}="{value}"')
+        return "{" + ",".join(parts) + "}"
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+#The function returns the process-wide metrics registry, creating it on first use.
+def get_metrics():
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+        return _metrics
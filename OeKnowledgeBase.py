@@ -0,0 +1,167 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from configuration.configurate_logs import setup_logger
+from configuration.config import oe_kb_path, oe_kb_ttl_days, oe_kb_min_chars, oe_kb_max_rows
+from Metrics import get_metrics
+
+logger = setup_logger()
+
+# Trennzeichen zwischen mehreren Nummern in upc/ean ("1K0 615 301 AA, 1K0615301AA")
+NUMBER_SEPARATORS = re.compile(r"[,;/|]+")
+NOT_ALNUM = re.compile(r"[^0-9A-Z]")
+
+#The function normalizes an OE number for lookups: upper case, without spaces, dots and dashes.
+def normalize_number(number):
+    return NOT_ALNUM.sub("", str(number or "").upper())
+
+#The function returns the normalized numbers of a list, dropping duplicates and numbers shorter than oe_kb_min_chars.
+def normalize_numbers(numbers):
+    normalized = []
+    for number in numbers or ():
+        number = normalize_number(number)
+        if len(number) >= oe_kb_min_chars and number not in normalized:
+            normalized.append(number)
+    return normalized
+
+#The function returns the product's own numbers (EAN/UPC fields) that are looked up in the knowledge base.
+def product_numbers(item):
+    numbers = []
+    for field in ("upc", "ean"):
+        numbers.extend(NUMBER_SEPARATORS.split(item.get(field) or ""))
+    return normalize_numbers(numbers)
+
+#The function replaces the compatibility table and the sources of an answer with the ones from the index.
+def fill_from_index(response_json, known):
+    response_json["kompatibilität"] = known["kompatibilität"]
+    response_json["Quelle"] = known["Quelle"]
+    return response_json
+
+#Local store of OE number -> compatibility rows and sources, learned from every parsed answer. Products whose numbers
+#are all known can be requested without web search and get their compatibility table from here.
+class OeKnowledgeBase:
+    def __init__(self, path=oe_kb_path, ttl_days=oe_kb_ttl_days, max_rows=oe_kb_max_rows):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.ttl = ttl_days * 86400
+        self.max_rows = max_rows
+        self.metrics = get_metrics()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS oe_numbers (
+                    oe_number TEXT PRIMARY KEY,
+                    compatibility TEXT NOT NULL,
+                    sources TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+            """)
+
+    #The function returns {"kompatibilität": rows, "Quelle": sources} merged over all numbers when every number has
+    #a known, non-expired compatibility table; otherwise None.
+    def lookup(self, numbers):
+        numbers = normalize_numbers(numbers)
+        if not numbers:
+            return None
+
+        entries = self.__read(numbers, time.time() - self.ttl)
+        if len(entries) < len(numbers) or not all(rows for rows, _ in entries.values()):
+            self.misses += 1
+            self.metrics.inc("oe_kb_lookups_total", outcome="miss")
+            return None
+
+        self.hits += 1
+        self.metrics.inc("oe_kb_lookups_total", outcome="hit")
+        rows, sources = [], []
+        for number in numbers:
+            _merge(rows, entries[number][0], self.max_rows)
+            _merge(sources, entries[number][1], self.max_rows)
+        return {"kompatibilität": rows, "Quelle": sources}
+
+    #The function fills an empty compatibility table of an answer from the index when all its OE numbers are known.
+    #Returns True when the answer was completed.
+    def complete(self, response_json):
+        if response_json.get("kompatibilität"):
+            return False
+        known = self.lookup(response_json.get("OE-Nummer"))
+        if not known:
+            return False
+        fill_from_index(response_json, known)
+        return True
+
+    def learn(self, response_json, numbers=()):
+        self.learn_many([(response_json, numbers)])
+
+    #The function stores the compatibility rows and sources of many (answer, product numbers) pairs in one transaction
+    #under every OE number of the answer and the product's own numbers (EAN/UPC). Each number keeps the table of the latest
+    #answer only, so the tables of different products that share a number are never mixed.
+    def learn_many(self, answers):
+        learned = {}
+        for response_json, numbers in answers:
+            rows = []
+            _merge(rows, [row for row in response_json.get("kompatibilität") or () if isinstance(row, dict) and row], self.max_rows)
+            if not rows:
+                continue
+            sources = []
+            _merge(sources, [source for source in response_json.get("Quelle") or () if source], self.max_rows)
+            for number in normalize_numbers(list(response_json.get("OE-Nummer") or ()) + list(numbers or ())):
+                learned[number] = (rows, sources)
+        if not learned:
+            return
+
+        now = time.time()
+        try:
+            with self.lock, self.connection:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO oe_numbers (oe_number, compatibility, sources, updated_at) VALUES (?, ?, ?, ?)",
+                    [
+                        (number, json.dumps(rows, ensure_ascii=False), json.dumps(sources, ensure_ascii=False), now)
+                        for number, (rows, sources) in learned.items()
+                    ]
+                )
+        except Exception as e:
+            logger.error(f"❌ OE knowledge base could not be updated: {e}")
+
+    def __read(self, numbers, not_before):
+        placeholders = ", ".join(["?"] * len(numbers))
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT oe_number, compatibility, sources FROM oe_numbers WHERE oe_number IN ({placeholders}) AND updated_at >= ?",
+                (*numbers, not_before)
+            ).fetchall()
+        return {number: (json.loads(compatibility), json.loads(sources)) for number, compatibility, sources in rows}
+
+    def report(self):
+        total = self.hits + self.misses
+        if total:
+            logger.info(f"📚 OE knowledge base: {self.hits} hit(s), {self.misses} miss(es), hit rate {self.hits / total:.1%}")
+
+#The function appends the values that are not in target yet, up to limit entries.
+def _merge(target, values, limit):
+    seen = {json.dumps(value, ensure_ascii=False, sort_keys=True) for value in target}
+    for value in values:
+        if len(target) >= limit:
+            return
+        key = json.dumps(value, ensure_ascii=False, sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            target.append(value)
+
+_knowledge_base = None
+_knowledge_base_lock = threading.Lock()
+
+#The function returns the process-wide OE knowledge base, creating it on first use.
+def get_oe_knowledge_base():
+    global _knowledge_base
+    with _knowledge_base_lock:
+        if _knowledge_base is None:
+            _knowledge_base = OeKnowledgeBase()
+        return _knowledge_base
@@ -0,0 +1,21 @@
+import os
+import threading
+
+_client = None
+_client_lock = threading.Lock()
+
+#The function returns the process-wide OpenAI client, creating it on first use.
+#openai and dotenv are imported only here, so commands that never call the API start without loading them.
+def get_openai_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            from dotenv import load_dotenv
+            from openai import OpenAI
+
+            load_dotenv()
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                raise ValueError("❌ OPENAI_API_KEY not found in .env file!")
+            _client = OpenAI(api_key=api_key)
+        return _client
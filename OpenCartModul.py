@@ -1,98 +1,445 @@
 from configuration.configurate_logs import setup_logger
-from configuration.config import host, user, password, db_name
-import re
-import pymysql
+from configuration.config import host, user, password, db_name, db_port
+from configuration.config import db_pool_min, db_pool_max, db_pool_timeout, db_pool_ping_interval
+from configuration.config import bulk_chunk_size, fetch_page_size
+from configuration.config import lease_enabled, worker_id, lease_sync_seconds, fingerprint_enabled
+from collections import deque
+import hashlib
+from contextlib import contextmanager
+import threading
+import time
+from HtmlRenderer import render_description
+from Metrics import get_metrics
 
 logger = setup_logger()
 
-class DatabaseModel:
-    def __init__(self):
-        self.connection = None       
+class ConnectionPool:
+    def __init__(self, min_size=db_pool_min, max_size=db_pool_max, timeout=db_pool_timeout, ping_interval=db_pool_ping_interval):
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.condition = threading.Condition()
+        self.idle = deque()
+        self.size = 0
+        self.warmed_up = False
+
+    def __create(self):
+        # pymysql wird erst beim ersten Verbindungsaufbau geladen
+        import pymysql
+
+        return pymysql.connect(
+            host=host,
+            port=db_port,
+            user=user,
+            password=password,
+            database=db_name,
+            charset="utf8mb4",
+            autocommit=True,
+            cursorclass=pymysql.cursors.DictCursor
+        )
+
+    #The function opens the configured minimum of connections once, on first use of the pool.
+    def __warm_up(self):
+        with self.condition:
+            if self.warmed_up:
+                return
+            self.warmed_up = True
+            missing = max(self.min_size - self.size, 0)
+            self.size += missing
+
+        for _ in range(missing):
+            try:
+                connection = self.__create()
+            except Exception as e:
+                logger.error(f"❌ Connection error: {e}")
+                with self.condition:
+                    self.size -= 1
+                continue
+            self.release(connection)
+
+    #The function takes a connection from the pool, checks idle ones for staleness and reconnects when needed.
+    def acquire(self):
+        self.__warm_up()
+        deadline = time.monotonic() + self.timeout
+        connection, idle_since = None, None
+
+        with self.condition:
+            while True:
+                if self.idle:
+                    connection, idle_since = self.idle.pop()
+                    break
+                if self.size < self.max_size:
+                    self.size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"No free MySQL connection after {self.timeout}s (pool size {self.max_size})")
+                self.condition.wait(remaining)
 
-    def __connect(self):
         try:
-            self.connection = pymysql.connect(
-                host=host,
-                port=3306,
-                user=user,
-                password=password,
-                database=db_name,
-                charset="utf8mb4",
-                cursorclass=pymysql.cursors.DictCursor
-            )
-            #logger.info("✅ successfully connected to MySQL")
+            if connection is None:
+                return self.__create()
+            if time.monotonic() - idle_since > self.ping_interval:
+                connection.ping(reconnect=True)
+            return connection
         except Exception as e:
             logger.error(f"❌ Connection error: {e}")
+            self.release(connection, discard=True)
+            raise
+
+    #The function returns a connection to the pool, or drops it if it is broken.
+    def release(self, connection, discard=False):
+        with self.condition:
+            if discard or connection is None or not connection.open:
+                self.size -= 1
+            else:
+                self.idle.append((connection, time.monotonic()))
+                connection = None
+            self.condition.notify()
+
+        if connection is not None:
+            try:
+                connection.close()
+            except:
+                pass
 
-    def __close(self):
-        if self.connection:
+    def close_all(self):
+        with self.condition:
+            idle, self.idle = list(self.idle), deque()
+            self.size -= len(idle)
+        for connection, _ in idle:
             try:
-                self.connection.close()
-                #logger.info("🔒 The connection is closed")
+                connection.close()
             except:
                 pass
 
+_pool = None
+_pool_lock = threading.Lock()
+_session = threading.local()
+
+#The function returns the process-wide connection pool, creating it on first use.
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+        return _pool
+
+#The function closes the idle connections of the process-wide pool, if one was created (on shutdown).
+def close_pool():
+    with _pool_lock:
+        pool = _pool
+    if pool is not None:
+        pool.close_all()
+
+class DatabaseModel:
+    def __init__(self, pool=None):
+        self.pool = pool or get_pool()
+        self.metrics = get_metrics()
+
+    #The context manager binds one pooled connection and one transaction to the current thread.
+    #Every query issued inside it (also from other DatabaseModel instances) shares that connection and is committed together.
+    @contextmanager
+    def session(self):
+        connection = getattr(_session, "connection", None)
+        if connection is not None:
+            yield connection
+            return
+
+        connection = self.pool.acquire()
+        _session.connection = connection
+        broken = False
+        try:
+            connection.begin()
+            yield connection
+            connection.commit()
+        except Exception:
+            try:
+                connection.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            _session.connection = None
+            self.pool.release(connection, discard=broken)
+
+    @contextmanager
+    def __connection(self):
+        connection = getattr(_session, "connection", None)
+        if connection is not None:
+            yield connection
+            return
+
+        import pymysql
+
+        connection = self.pool.acquire()
+        broken = False
+        try:
+            yield connection
+        except pymysql.err.OperationalError:
+            broken = True
+            raise
+        finally:
+            self.pool.release(connection, discard=broken)
+
     #The function executes an SQL query and returns all the rows returned.
     def fetch_all(self, sql, params=None):
         result = [] 
         try:
-            self.__connect()
-            with self.connection.cursor() as cursor:
-                cursor.execute(sql, params)
-                result = cursor.fetchall()
+            with self.__connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(sql, params)
+                    result = cursor.fetchall()
+            self.metrics.inc("db_roundtrips_total", kind="fetch_all")
         except Exception as e:
             logger.error(f"❌ SQL Execution Error (fetch_all): {e}")
             raise e
-        finally:
-            self.__close()
         return result
 
      #The function executes an SQL query and returns one row of results.
     def fetch_one(self, sql, params=None):
         result = None
-        self.__connect()
         try:
-            with self.connection.cursor() as cursor:
-                cursor.execute(sql, params)
-                result = cursor.fetchone()
+            with self.__connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(sql, params)
+                    result = cursor.fetchone()
+            self.metrics.inc("db_roundtrips_total", kind="fetch_one")
         except Exception as e:
             logger.error(f"❌ SQL Execution Error (fetch_one): {e}")
             raise e
-        finally:
-            self.__close()
         return result   
     
-   
+    #The function executes a list of (sql, params) statements in one transaction.
     def execute_sql_batch(self, statements):
-        self.__connect()
         try:
-            cursor = self.connection.cursor()           
-            for sql, params in statements:
-                # params kann None oder ein Tupel/Liste sein
-                if params is None:
-                    cursor.execute(sql)
-                else:
-                    cursor.execute(sql, params)
-
-            self.connection.commit()
+            with self.session() as connection:
+                with connection.cursor() as cursor:
+                    for sql, params in statements:
+                        # params kann None oder ein Tupel/Liste sein
+                        if params is None:
+                            cursor.execute(sql)
+                        else:
+                            cursor.execute(sql, params)
+            self.metrics.inc("db_roundtrips_total", len(statements), kind="execute")
         except Exception as e:
-            logger.error(f"❌ SQL Execution Error (fetch_one): {e}")
-            if self.connection.is_connected():
-                self.connection.rollback()
+            logger.error(f"❌ SQL Execution Error (execute_sql_batch): {e}")
             raise e
-        finally:
-            self.__close()
+
+PRODUCT_COLUMNS = "pd.product_id, pd.name, p.upc, p.ean, p.ebay_updatetime, p.date_added"
+
+ELIGIBLE_WHERE = """pd.language_id=2 
+                     AND p.status=1 AND p.sku <> ''  
+                     AND p.quantity>0 AND p.price>0 AND ebay_user>0 AND (p.upc <> '' or p.ean <> '')"""
+
+BACKLOG_WHERE = f"""  ( p.chatgpt_state IS NULL AND {ELIGIBLE_WHERE})
+              """
+
+# Fingerprint of everything that feeds PrepareRequestContent: name, EAN, UPC and the prompt text
+# (same value as input_fingerprint; used by incremental runs and the backfill in sql/fingerprint.sql)
+FINGERPRINT_SQL = """SHA2(CONCAT_WS(CHAR(31 USING utf8mb4), pd.name, p.upc, p.ean,
+                        (SELECT prompt_text FROM oc_prompts_ai WHERE prompt_typ = 1)), 256)"""
+
+# Inkrementeller Lauf: zusätzlich bereits beschriebene Artikel, deren Eingaben oder Prompt sich geändert haben.
+# Zeilen ohne gespeicherten Fingerprint (vor dessen Einführung beschrieben) werden nicht erneut angefragt.
+INCREMENTAL_WHERE = f"""  ( (p.chatgpt_state IS NULL OR p.chatgpt_fingerprint <> {FINGERPRINT_SQL}) AND {ELIGIBLE_WHERE})
+              """
+
+# Zeilen, die kein anderer Worker gerade bearbeitet
+LEASE_FREE = "(p.chatgpt_lease_until IS NULL OR p.chatgpt_lease_until < NOW())" if lease_enabled else "1 = 1"
+LEASE_RELEASE = ",\n                p.chatgpt_lease_owner = NULL, p.chatgpt_lease_until = NULL" if lease_enabled else ""
+
+#The function returns the fingerprint (FINGERPRINT_SQL) of the inputs a request is built from: name, UPC, EAN and prompt text.
+#It is computed when the request is built, so a product edited while its batch is running keeps the old fingerprint.
+def input_fingerprint(item, prompt_text):
+    # CONCAT_WS überspringt NULL-Werte
+    values = (item.get("name"), item.get("upc"), item.get("ean"), prompt_text)
+    return hashlib.sha256("\x1f".join(str(value) for value in values if value is not None).encode("utf-8")).hexdigest()
+
+#The function returns the (sql, params) statement that sets chatgpt_state, releases the lease and, with fingerprint_enabled,
+#stores the fingerprint of the inputs each description was generated from (fingerprints: product_id -> fingerprint).
+def _mark_processed(product_ids, fingerprints):
+    params = []
+    fingerprint_part = ""
+    if fingerprint_enabled:
+        fingerprint_part = ", p.chatgpt_fingerprint = CASE p.product_id " + " ".join(["WHEN %s THEN %s"] * len(product_ids)) + " END"
+        for product_id in product_ids:
+            params.extend((product_id, fingerprints.get(product_id)))
+    sql = f"""UPDATE oc_product AS p
+            SET p.chatgpt_state = 1, p.chatgpt_calltime = NOW(){fingerprint_part}{LEASE_RELEASE}
+            WHERE p.product_id IN ({", ".join(["%s"] * len(product_ids))})"""
+    return sql, params + list(product_ids)
+
+STORED_COLUMNS = "description, meta_title, meta_keyword, tag"
+
+#The function returns the stored (description, meta_title, meta_keyword, tag) of a row for comparison with render_description.
+def _stored(row):
+    return (row["description"] or "", row["meta_title"] or "", row["meta_keyword"] or "", row["tag"] or "")
 
 class OpencartProductController:  
-    def __init__(self):
+    #incremental=True also selects processed products whose name/EAN/UPC or prompt changed since their description was written.
+    def __init__(self, incremental=False):
         self.db_model = DatabaseModel() 
+        self.incremental = incremental
+
+    @property
+    def backlog_where(self):
+        return INCREMENTAL_WHERE if self.incremental else BACKLOG_WHERE
         
     #The fetch_products_and_prompt function retrieves products and the corresponding prompt from the database.
     def fetch_products_and_prompt(self, limit=None, pid=None, prompt_typ=1):
         items = self.__read_products(limit=limit, pid=pid)
         prompt_text = self.__read_prompt(prompt_typ)
         return items, prompt_text
+
+    #The function loads the prompt text of the given type.
+    def fetch_prompt(self, prompt_typ=1):
+        return self.__read_prompt(prompt_typ)
+
+    #The function yields the unprocessed backlog page by page (keyset pagination on ebay_updatetime, product_id),
+    #so full-catalog runs keep only one page in memory. limit=None walks the whole backlog.
+    #Every page is leased to this worker for lease_seconds first; rows claimed by another worker are skipped.
+    def iter_products(self, limit=None, page_size=fetch_page_size, lease_seconds=lease_sync_seconds):
+        # Zuerst Zeilen ohne ebay_updatetime (sortieren in MySQL vorne), danach der Rest
+        cursor = (True, None, 0)
+        delivered = 0
+
+        while limit is None or delivered < limit:
+            size = page_size if limit is None else min(page_size, limit - delivered)
+            try:
+                with self.db_model.metrics.timer("db_fetch"):
+                    page = self.__fetch_products_page(cursor, size)
+            except Exception as e:
+                logger.error(f"❌ Error reading goods: {e}")
+                return
+
+            if page:
+                logger.info(f"Received {len(page)} items for processing (chatgpt_state IS NULL)")
+                last = page[-1]
+                cursor = (cursor[0], last["ebay_updatetime"], last["product_id"])
+                claimed = self.claim_products(page, lease_seconds)
+                delivered += len(claimed)
+                yield from claimed
+
+            if len(page) < size:
+                if not cursor[0]:
+                    return
+                cursor = (False, None, 0)
     
+    #The function returns the unprocessed products added within the last `hours` hours, newest first (leased to this worker).
+    def fetch_fresh_products(self, hours, limit, lease_seconds=lease_sync_seconds):
+        try:
+            with self.db_model.metrics.timer("db_fetch"):
+                items = self.__fetch_products_where(
+                    f"p.date_added >= NOW() - INTERVAL %s HOUR AND {LEASE_FREE}", (hours,), "p.date_added DESC", limit
+                )
+            return self.claim_products(items, lease_seconds)
+        except Exception as e:
+            logger.error(f"❌ Error reading fresh goods: {e}")
+            return []
+
+    #The function returns those of the given products that are still unprocessed, in chunks of page_size IDs.
+    #Products this worker already holds (e.g. from its own batches) are re-leased for lease_seconds.
+    def fetch_products_by_ids(self, product_ids, page_size=fetch_page_size, lease_seconds=lease_sync_seconds):
+        product_ids = list(product_ids)
+        items = []
+        try:
+            for start in range(0, len(product_ids), page_size):
+                chunk = product_ids[start:start + page_size]
+                with self.db_model.metrics.timer("db_fetch"):
+                    page = self.__fetch_products_where(
+                        f"p.product_id IN ({', '.join(['%s'] * len(chunk))})", tuple(chunk), "p.product_id", len(chunk)
+                    )
+                items += self.claim_products(page, lease_seconds)
+        except Exception as e:
+            logger.error(f"❌ Error reading goods by ID: {e}")
+        return items
+
+    #The function returns {product_id: {"product_id", "upc", "ean"}} of the given products.
+    def fetch_codes(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return {}
+        with self.db_model.metrics.timer("db_fetch"):
+            rows = self.db_model.fetch_all(
+                f"SELECT product_id, upc, ean FROM oc_product WHERE product_id IN ({', '.join(['%s'] * len(product_ids))})", product_ids
+            )
+        return {row["product_id"]: row for row in rows}
+
+    #The function returns True when oc_product has all of the given columns (e.g. those added by a migration in sql/).
+    def has_columns(self, *columns):
+        row = self.db_model.fetch_one(
+            f"""SELECT COUNT(*) AS found FROM information_schema.COLUMNS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'oc_product' AND COLUMN_NAME IN ({', '.join(['%s'] * len(columns))})""",
+            columns
+        )
+        return bool(row) and row["found"] == len(columns)
+
+    #The function leases the given products to this worker and returns only those it got.
+    #The conditional UPDATE is atomic per row: of two workers racing for a product exactly one wins, and a lease
+    #whose holder died (chatgpt_lease_until in the past) is taken over. Leases are released when the result is written.
+    def claim_products(self, items, lease_seconds=lease_sync_seconds):
+        if not lease_enabled or not items:
+            return items
+        claimed = self.claim_ids([item["product_id"] for item in items], lease_seconds)
+        return [item for item in items if item["product_id"] in claimed]
+
+    #The function leases the given product IDs to this worker (or renews its own leases) and returns the set it holds.
+    def claim_ids(self, product_ids, lease_seconds=lease_sync_seconds):
+        product_ids = list(product_ids)
+        if not lease_enabled or not product_ids:
+            return set(product_ids)
+        id_placeholders = ", ".join(["%s"] * len(product_ids))
+
+        with self.db_model.metrics.timer("db_claim"), self.db_model.session():
+            self.db_model.execute_sql_batch([(
+                f"""UPDATE oc_product
+                    SET chatgpt_lease_owner = %s, chatgpt_lease_until = NOW() + INTERVAL %s SECOND
+                    WHERE product_id IN ({id_placeholders})
+                      AND (chatgpt_lease_until IS NULL OR chatgpt_lease_until < NOW() OR chatgpt_lease_owner = %s)""",
+                (worker_id, lease_seconds, *product_ids, worker_id)
+            )])
+            rows = self.db_model.fetch_all(
+                f"SELECT product_id FROM oc_product WHERE product_id IN ({id_placeholders}) AND chatgpt_lease_owner = %s",
+                (*product_ids, worker_id)
+            )
+
+        claimed = {row["product_id"] for row in rows}
+        if len(claimed) < len(product_ids):
+            self.db_model.metrics.inc("lease_conflicts_total", len(product_ids) - len(claimed))
+            logger.info(f"🔒 {len(product_ids) - len(claimed)} of {len(product_ids)} item(s) are leased by another worker, skipping them")
+        return claimed
+
+    #The function renews the leases of products this process keeps working on (e.g. items of a follow-up batch),
+    #whoever holds them now — the submitting process may be a different one.
+    def extend_leases(self, product_ids, lease_seconds):
+        product_ids = list(product_ids)
+        if not lease_enabled or not product_ids:
+            return
+        try:
+            self.db_model.execute_sql_batch([(
+                f"""UPDATE oc_product
+                    SET chatgpt_lease_owner = %s, chatgpt_lease_until = NOW() + INTERVAL %s SECOND
+                    WHERE product_id IN ({', '.join(['%s'] * len(product_ids))})""",
+                (worker_id, lease_seconds, *product_ids)
+            )])
+        except Exception as e:
+            logger.error(f"❌ Error extending leases: {e}")
+
+    #The function releases the leases of the given products, whoever holds them.
+    def release_leases(self, product_ids):
+        product_ids = list(product_ids)
+        if not lease_enabled or not product_ids:
+            return
+        try:
+            self.db_model.execute_sql_batch([(
+                f"UPDATE oc_product SET chatgpt_lease_owner = NULL, chatgpt_lease_until = NULL WHERE product_id IN ({', '.join(['%s'] * len(product_ids))})",
+                product_ids
+            )])
+        except Exception as e:
+            logger.error(f"❌ Error releasing leases: {e}")
+
     def ProcessProduct(self, product_id, response):        
         logger.info(f"Processing of Item ID={product_id}'") 
         try:           
@@ -110,63 +457,124 @@ class OpencartProductController:
         except Exception as e:
             logger.error(f"❌ Error in process_product for ID={product_id}: {e}")
     
-    def UpdateItemDescAndSeo(self, product_id, response_json):        
+    #fingerprint is the input_fingerprint of the request the response answers.
+    def UpdateItemDescAndSeo(self, product_id, response_json, fingerprint=None):        
         try:
-            row = self.db_model.fetch_one("SELECT description FROM oc_product_description WHERE product_id = %s", product_id)
-            old_description = row["description"] if row and row["description"] else ""
-
-            description_html = response_json.get("Verkaufstext", "")
-            description_html = re.sub(r"(?<!<br>)(?<=\.)\s+", "<br/>", description_html)
-
-            meta_title = response_json.get("titel", "")
-            meta_keyword = response_json.get("Kurzbeschreibung", "")
-            tag_seo = response_json.get("SEO", "")
-            oenummer = self.__array_to_string(response_json.get("OE-Nummer", []))
-            quelle =  self.__array_to_string(response_json.get("Quelle", []))
-            if oenummer:
-                oenummer="<div class='item-oe-nummer'>OE-Nummer: " + oenummer + "</div>"
-            if quelle:
-                quelle="<div class='item-quelle'>Quelle: <br/>" + quelle + "</div>" 
-
-            compare_text = self.__array_to_html_table(response_json.get("kompatibilität", []))           
-
-            block1 = f"<div class='item-desc-text'>{description_html}</div>"
-            block2 = ""
-            if compare_text:
-                block2 = f"<div class='item-compability-block'><h4>Kompatibilitätsliste (ohne Gewähr)</h4>{compare_text}</div>"
-                
-            full_description = f"<div class='item-desc-text'>{old_description}</div> <div class='addedTextAi'>{block1}{oenummer}{block2}</div>".strip()
-            # logger.info(full_description)
-
-            sql1 = """
-                UPDATE oc_product_description
-                SET description = %s,
-                    meta_title = %s,
-                    meta_keyword = %s,
-                    tag = %s
-                WHERE product_id = %s
-            """
-            sql2 = "UPDATE oc_product SET chatgpt_state = 1, chatgpt_calltime = NOW() WHERE product_id = %s"
-            sql3 = "UPDATE oc_kb_ebay_profile_products SET status='Updated', revise='1' WHERE ebay_status='Active' and id_product = %s"
-            statements = [
-                (sql1, (full_description, meta_title, meta_keyword,  tag_seo, product_id)),
-                (sql2, (product_id)),
-                (sql3, (product_id))
-            ]
-            self.db_model.execute_sql_batch(statements)
-                
+            with self.db_model.metrics.timer("db_write"), self.db_model.session():
+                self.__update_item_desc_and_seo(product_id, response_json, fingerprint)
             logger.info(f"✅ Updated product {product_id}, chatgpt_state=1")
         except Exception as e:
             logger.error(f"❌ Database update error: {e}")
         finally:
             pass
 
+    #The function reads the old description and writes the new one inside the caller's session (one connection, one transaction).
+    #Description and eBay revise flag are only written when the rendered output differs from what is stored.
+    def __update_item_desc_and_seo(self, product_id, response_json, fingerprint):
+        row = self.db_model.fetch_one(f"SELECT {STORED_COLUMNS} FROM oc_product_description WHERE product_id = %s", product_id)
+        old_description = row["description"] if row and row["description"] else ""
+
+        rendered = render_description(old_description, response_json)
+        full_description, meta_title, meta_keyword, tag_seo = rendered
+
+        sql1 = """
+            UPDATE oc_product_description
+            SET description = %s,
+                meta_title = %s,
+                meta_keyword = %s,
+                tag = %s
+            WHERE product_id = %s
+        """
+        mark_processed = _mark_processed([product_id], {product_id: fingerprint})
+        sql3 = "UPDATE oc_kb_ebay_profile_products SET status='Updated', revise='1' WHERE ebay_status='Active' and id_product = %s"
+        if row and _stored(row) == rendered:
+            self.db_model.metrics.inc("descriptions_unchanged_total")
+            logger.info(f"⏭️ Description of product {product_id} unchanged, skipping UPDATE and eBay revise")
+            statements = [mark_processed]
+        else:
+            statements = [
+                (sql1, (full_description, meta_title, meta_keyword,  tag_seo, product_id)),
+                mark_processed,
+                (sql3, (product_id))
+            ]
+        self.db_model.execute_sql_batch(statements)
+
+    #The function writes many rendered products at once: one SELECT and three multi-row UPDATEs per chunk.
+    #Products whose rendered description is byte-identical to the stored one only get chatgpt_state set.
+    #Each chunk runs in its own transaction, so a failing chunk is rolled back without touching the others.
+    #sections optionally maps product_id to its pre-rendered AI section (render_ai_section), so only the merge with the
+    #stored description happens while the transaction is open. fingerprints maps product_id to its input_fingerprint.
+    #written, when given, collects the product IDs of the chunks that were committed.
+    def UpdateItemsBulk(self, results, chunk_size=bulk_chunk_size, sections=None, fingerprints=None, written=None):
+        updated = 0
+        for start in range(0, len(results), chunk_size):
+            chunk = results[start:start + chunk_size]
+            try:
+                with self.db_model.metrics.timer("db_write_bulk"), self.db_model.session():
+                    self.__update_chunk(chunk, sections or {}, fingerprints or {})
+                updated += len(chunk)
+                if written is not None:
+                    written.update(product_id for product_id, _ in chunk)
+                logger.info(f"✅ Bulk-updated {len(chunk)} products, chatgpt_state=1")
+            except Exception as e:
+                product_ids = [product_id for product_id, _ in chunk]
+                logger.error(f"❌ Bulk update failed, chunk rolled back ({len(chunk)} products: {product_ids[0]}..{product_ids[-1]}): {e}")
+        return updated
+
+    def __update_chunk(self, chunk, sections, fingerprints):
+        # Bei doppelten product_id gewinnt das letzte Ergebnis
+        responses = dict(chunk)
+        product_ids = list(responses)
+        id_placeholders = ", ".join(["%s"] * len(product_ids))
+
+        rows = self.db_model.fetch_all(
+            f"SELECT product_id, {STORED_COLUMNS} FROM oc_product_description WHERE product_id IN ({id_placeholders})",
+            product_ids
+        )
+        stored = {}
+        for row in rows:
+            stored.setdefault(row["product_id"], _stored(row))
+
+        rendered = {
+            product_id: render_description(stored[product_id][0] if product_id in stored else "", responses[product_id], sections.get(product_id))
+            for product_id in product_ids
+        }
+        mark_processed = _mark_processed(product_ids, fingerprints)
+
+        changed_ids = [product_id for product_id in product_ids if stored.get(product_id) != rendered[product_id]]
+        unchanged = len(product_ids) - len(changed_ids)
+        if unchanged:
+            self.db_model.metrics.inc("descriptions_unchanged_total", unchanged)
+            logger.info(f"⏭️ {unchanged} description(s) unchanged, skipping UPDATE and eBay revise")
+        if not changed_ids:
+            self.db_model.execute_sql_batch([mark_processed])
+            return
+
+        columns = ("description", "meta_title", "meta_keyword", "tag")
+        changed_placeholders = ", ".join(["%s"] * len(changed_ids))
+        case_when = " ".join(["WHEN %s THEN %s"] * len(changed_ids))
+        set_part = ",\n".join(f"{column} = CASE product_id {case_when} END" for column in columns)
+        params = []
+        for index in range(len(columns)):
+            for product_id in changed_ids:
+                params.extend((product_id, rendered[product_id][index]))
+        params.extend(changed_ids)
+
+        sql1 = f"UPDATE oc_product_description SET {set_part} WHERE product_id IN ({changed_placeholders})"
+        sql3 = f"UPDATE oc_kb_ebay_profile_products SET status='Updated', revise='1' WHERE ebay_status='Active' and id_product IN ({changed_placeholders})"
+        statements = [
+            (sql1, params),
+            mark_processed,
+            (sql3, changed_ids)
+        ]
+        self.db_model.execute_sql_batch(statements)
 
     #The read_products function reads products from the database — either one by pid or a list by limit.
     def __read_products(self, limit=None, pid=None):       
         items = []
         try:
-            items = self.__fetch_products(limit=limit, pid=pid)            
+            with self.db_model.metrics.timer("db_fetch"):
+                items = self.__fetch_products(limit=limit, pid=pid)
             logger.info(f"Received {len(items)} items for processing (chatgpt_state IS NULL)")
             
             if items:
@@ -184,7 +592,8 @@ class OpencartProductController:
     def __read_prompt(self, prompt_typ):
         prompt_text = None
         try:
-            prompt_text = self.__fetch_prompt(prompt_typ)
+            with self.db_model.metrics.timer("db_fetch"):
+                prompt_text = self.__fetch_prompt(prompt_typ)
             
             if prompt_text:
                 logger.info("✅ Prompt successfully loaded from the database")
@@ -201,17 +610,14 @@ class OpencartProductController:
         if pid is not None:
             WHERE_PART = " p.product_id = %s"
         else:
-            WHERE_PART = f"""  ( p.chatgpt_state IS NULL AND pd.language_id=2 
-                                 AND p.status=1 AND p.sku <> ''  
-                                 AND p.quantity>0 AND p.price>0 AND ebay_user>0 AND (p.upc <> '' or p.ean <> ''))
-                          """
+            WHERE_PART = self.backlog_where
 
-        sql = f"""SELECT pd.product_id, pd.name, p.upc, p.ean 
+        sql = f"""SELECT {PRODUCT_COLUMNS} 
                     FROM oc_product_description as pd 
                         JOIN oc_language as l on pd.language_id = l.language_id
                         JOIN oc_product as p on pd.product_id = p.product_id
                     WHERE l.name = 'German' AND {WHERE_PART}
-                    ORDER BY p.ebay_updatetime
+                    ORDER BY p.ebay_updatetime, p.product_id
                 """
         if pid is not None:
             params = (pid,)
@@ -220,45 +626,48 @@ class OpencartProductController:
             params = (limit,)
             
         return self.db_model.fetch_all(sql, params)   
+
+    #The function reads one keyset page after cursor = (null_phase, last ebay_updatetime, last product_id).
+    def __fetch_products_page(self, cursor, page_size):
+        null_phase, last_updatetime, last_product_id = cursor
+        if null_phase:
+            KEYSET_PART = "p.ebay_updatetime IS NULL AND p.product_id > %s"
+            ORDER_PART = "p.product_id"
+            params = (last_product_id, page_size)
+        elif last_updatetime is None:
+            KEYSET_PART = "p.ebay_updatetime IS NOT NULL"
+            ORDER_PART = "p.ebay_updatetime, p.product_id"
+            params = (page_size,)
+        else:
+            KEYSET_PART = "(p.ebay_updatetime > %s OR (p.ebay_updatetime = %s AND p.product_id > %s))"
+            ORDER_PART = "p.ebay_updatetime, p.product_id"
+            params = (last_updatetime, last_updatetime, last_product_id, page_size)
+
+        sql = f"""SELECT {PRODUCT_COLUMNS} 
+                    FROM oc_product_description as pd 
+                        JOIN oc_language as l on pd.language_id = l.language_id
+                        JOIN oc_product as p on pd.product_id = p.product_id
+                    WHERE l.name = 'German' AND {self.backlog_where} AND {LEASE_FREE} AND {KEYSET_PART}
+                    ORDER BY {ORDER_PART}
+                    LIMIT %s
+                """
+        return self.db_model.fetch_all(sql, params)
     
+    #The function reads up to limit backlog products that also match where_part.
+    def __fetch_products_where(self, where_part, params, order_part, limit):
+        sql = f"""SELECT {PRODUCT_COLUMNS} 
+                    FROM oc_product_description as pd 
+                        JOIN oc_language as l on pd.language_id = l.language_id
+                        JOIN oc_product as p on pd.product_id = p.product_id
+                    WHERE l.name = 'German' AND {self.backlog_where} AND {where_part}
+                    ORDER BY {order_part}
+                    LIMIT %s
+                """
+        return self.db_model.fetch_all(sql, params + (limit,))
+
     #The function gets the prompt text from the database according to the specified prompt_typ type
     def __fetch_prompt(self, prompt_typ):
         sql = "SELECT prompt_text FROM oc_prompts_ai WHERE prompt_typ = %s"
         params = (prompt_typ,)       
         row = self.db_model.fetch_one(sql, params)        
         return row["prompt_text"] if row and row.get("prompt_text") else None
-
-    def __array_to_html_table(self, array):
-        if not array or not isinstance(array, list):
-            return ""
-
-        html = """
-            <table class='item-compability-table'>
-                <tr>
-                    <th>Marke</th>
-                    <th>Modell</th>
-                    <th>Baujahr</th>
-                    <th>Motorvarianten</th>
-                    <th>Bemerkung</th>
-                </tr>
-            """
-
-        for item in array:
-            html += f"""
-        <tr>
-            <td>{item.get('marke', '')}</td>
-            <td>{item.get('modell', '')}</td>
-            <td>{item.get('baujahr_von', '')} - {item.get('baujahr_bis', '')}</td>
-            <td>{'<br>'.join(item.get('motorvarianten', []))}</td>
-            <td>{item.get('bemerkung', '')}</td>
-        </tr>
-            """
-
-        html += "</table>"
-        return html
-
-    def __array_to_string(self, array):
-        if not array or not isinstance(array, list):
-            return ""
-        return ", ".join(array)
-    
\ No newline at end of file
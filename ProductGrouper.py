@@ -0,0 +1,54 @@
+import re
+from configuration.configurate_logs import setup_logger
+
+logger = setup_logger()
+
+NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+#The function normalizes an EAN/UPC: only digits and letters, lower case, leading zeros removed.
+def normalize_code(value):
+    code = NON_ALNUM.sub("", (value or "").lower())
+    return code.lstrip("0")
+
+#The function normalizes a product name so that listings differing only in case, punctuation or word order match.
+def normalize_name(name):
+    tokens = NON_ALNUM.sub(" ", (name or "").lower()).split()
+    return " ".join(sorted(set(tokens)))
+
+def group_key(item):
+    ean = normalize_code(item.get("ean"))
+    if ean:
+        return "ean:" + ean
+    upc = normalize_code(item.get("upc"))
+    if upc:
+        return "upc:" + upc
+    return "name:" + normalize_name(item.get("name"))
+
+#The function collapses items with the same normalized EAN/UPC/name key.
+#It returns one representative per group; its "group_product_ids" lists every product_id of the group.
+def group_items(items):
+    groups = {}
+    for item in items:
+        key = group_key(item)
+        representative = groups.get(key)
+        if representative is None:
+            representative = dict(item)
+            representative["group_product_ids"] = []
+            groups[key] = representative
+        representative["group_product_ids"].append(item["product_id"])
+
+    representatives = list(groups.values())
+    if len(representatives) < len(items):
+        logger.info(f"🧩 Grouped {len(items)} items into {len(representatives)} requests (duplication ratio {len(items) / len(representatives):.2f})")
+    return representatives
+
+def group_members(representatives):
+    return {item["product_id"]: item.get("group_product_ids", [item["product_id"]]) for item in representatives}
+
+#The function copies each (product_id, response) result to every product_id of its group.
+def fan_out(results, members):
+    return [
+        (member_id, response_json)
+        for product_id, response_json in results
+        for member_id in members.get(product_id, [product_id])
+    ]
@@ -0,0 +1,21 @@
+from functools import lru_cache
+
+# Platzhalter im statischen Teil: verweist auf die Produktangabe in der Nutzernachricht
+PRODUCT_REFERENCE = "siehe Artikelangabe in der Nutzernachricht"
+SUFFIX_TEMPLATE = 'Artikel: "{name}"'
+
+class CompiledPrompt:
+    def __init__(self, instructions, suffix_template):
+        self.instructions = instructions
+        self.suffix_template = suffix_template
+
+    #The function returns the small per-product part of the prompt.
+    def render(self, product_name):
+        return self.suffix_template.replace("{name}", product_name)
+
+#The function splits a prompt template from oc_prompts_ai into a static instruction prefix and a per-product suffix.
+#The product name no longer appears inside the long instructions, so every request starts with the same
+#tokens and the provider's prefix cache can serve them.
+@lru_cache(maxsize=8)
+def compile_prompt(template):
+    return CompiledPrompt(template.replace("{name}", PRODUCT_REFERENCE), SUFFIX_TEMPLATE)
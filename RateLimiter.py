@@ -0,0 +1,81 @@
+import threading
+import time
+from configuration.configurate_logs import setup_logger
+
+logger = setup_logger()
+
+class TokenBucket:
+    def __init__(self, capacity_per_minute):
+        self.capacity = float(capacity_per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def __refill(self, now):
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    #The function returns how many seconds are left until the bucket holds the requested amount.
+    def time_until(self, amount, now):
+        self.__refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount):
+        self.tokens -= min(amount, self.capacity)
+
+    def set_factor(self, factor):
+        self.rate = self.capacity * factor / 60.0
+
+class RateLimiter:
+    def __init__(self, requests_per_minute, tokens_per_minute, min_factor=0.1):
+        self.lock = threading.Lock()
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.min_factor = min_factor
+        self.factor = 1.0
+        self.blocked_until = 0.0
+        self.consecutive_limits = 0
+
+    #The function blocks the calling thread until one request and the estimated tokens fit into both buckets.
+    def acquire(self, estimated_tokens):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                wait = max(
+                    self.blocked_until - now,
+                    self.requests.time_until(1, now),
+                    self.tokens.time_until(estimated_tokens, now),
+                )
+                if wait <= 0:
+                    self.requests.consume(1)
+                    self.tokens.consume(estimated_tokens)
+                    return
+            time.sleep(min(wait, 5.0))
+
+    #The function halves the allowed rate after a 429 response and pauses all workers for the back-off delay.
+    def on_rate_limited(self, retry_after=None):
+        with self.lock:
+            self.consecutive_limits += 1
+            self.factor = max(self.min_factor, self.factor * 0.5)
+            self.requests.set_factor(self.factor)
+            self.tokens.set_factor(self.factor)
+
+            delay = retry_after if retry_after else min(60.0, 2.0 ** self.consecutive_limits)
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+
+        logger.warning(f"🐢 Rate limit hit — throttling to {self.factor:.0%} of configured RPM/TPM, pausing {delay:.1f}s")
+        return delay
+
+    #The function slowly restores the allowed rate after successful requests.
+    def on_success(self):
+        with self.lock:
+            self.consecutive_limits = 0
+            if self.factor < 1.0:
+                self.factor = min(1.0, self.factor + 0.05)
+                self.requests.set_factor(self.factor)
+                self.tokens.set_factor(self.factor)
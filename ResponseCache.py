@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from configuration.configurate_logs import setup_logger
+from configuration.config import response_cache_path, response_cache_ttl_days, response_cache_max_entries
+
+logger = setup_logger()
+
+class ResponseCache:
+    def __init__(self, path=response_cache_path, ttl_days=response_cache_ttl_days, max_entries=response_cache_max_entries):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.ttl = ttl_days * 86400
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.puts_since_eviction = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    cache_key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access);
+                CREATE TABLE IF NOT EXISTS pending (
+                    custom_id TEXT PRIMARY KEY,
+                    cache_key TEXT NOT NULL
+                );
+            """)
+            columns = [row[1] for row in self.connection.execute("PRAGMA table_info(pending)")]
+            if "chars" not in columns:
+                self.connection.execute("ALTER TABLE pending ADD COLUMN chars INTEGER")
+
+    #The function builds the content address of a request from the model, the tools and the fully expanded prompt.
+    @staticmethod
+    def make_key(model, tools, prompt):
+        payload = json.dumps({"model": model, "tools": tools or [], "prompt": prompt}, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    #The function returns the cached response for the key, or None if it is missing or older than the TTL.
+    def get(self, key):
+        now = time.time()
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT response, created_at FROM responses WHERE cache_key = ?", (key,)
+            ).fetchone()
+
+            if row and now - row[1] <= self.ttl:
+                self.connection.execute("UPDATE responses SET last_access = ? WHERE cache_key = ?", (now, key))
+                self.hits += 1
+                return json.loads(row[0])
+
+            if row:
+                self.connection.execute("DELETE FROM responses WHERE cache_key = ?", (key,))
+            self.misses += 1
+            return None
+
+    def put(self, key, response_json):
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (cache_key, response, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(response_json, ensure_ascii=False), now, now)
+            )
+            self.puts_since_eviction += 1
+            if self.puts_since_eviction >= 100:
+                self.__evict(now)
+
+    #The function drops expired entries and, above max_entries, the least recently used ones.
+    def __evict(self, now):
+        self.puts_since_eviction = 0
+        self.connection.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        excess = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self.connection.execute(
+                "DELETE FROM responses WHERE cache_key IN (SELECT cache_key FROM responses ORDER BY last_access LIMIT ?)",
+                (excess,)
+            )
+
+    #Batch requests are answered asynchronously: the key is remembered per custom_id until the result arrives,
+    #together with the prompt length of the request (chars) for the token calibration.
+    def remember_pending(self, custom_ids_keys_and_chars):
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO pending (custom_id, cache_key, chars) VALUES (?, ?, ?)", custom_ids_keys_and_chars
+            )
+
+    #The function returns {custom_id: prompt chars} of the given pending batch requests.
+    def pending_chars(self, custom_ids):
+        custom_ids = list(custom_ids)
+        chars = {}
+        with self.lock:
+            for start in range(0, len(custom_ids), 500):
+                chunk = custom_ids[start:start + 500]
+                rows = self.connection.execute(
+                    f"SELECT custom_id, chars FROM pending WHERE custom_id IN ({', '.join('?' * len(chunk))}) AND chars IS NOT NULL",
+                    chunk
+                ).fetchall()
+                chars.update(rows)
+        return chars
+
+    #The function stores a list of (custom_id, response_json) batch results under the keys remembered at submission.
+    def resolve_pending(self, results):
+        now = time.time()
+        with self.lock, self.connection:
+            for custom_id, response_json in results:
+                row = self.connection.execute("SELECT cache_key FROM pending WHERE custom_id = ?", (custom_id,)).fetchone()
+                if not row:
+                    continue
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO responses (cache_key, response, created_at, last_access) VALUES (?, ?, ?, ?)",
+                    (row[0], json.dumps(response_json, ensure_ascii=False), now, now)
+                )
+                self.connection.execute("DELETE FROM pending WHERE custom_id = ?", (custom_id,))
+                self.puts_since_eviction += 1
+            if self.puts_since_eviction >= 100:
+                self.__evict(now)
+
+    def report(self):
+        total = self.hits + self.misses
+        if total:
+            logger.info(f"🗄️ Response cache: {self.hits} hit(s), {self.misses} miss(es), hit rate {self.hits / total:.1%}")
+
+_cache = None
+_cache_lock = threading.Lock()
+
+#The function returns the process-wide response cache, creating it on first use.
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
@@ -0,0 +1,180 @@
+import json
+from configuration.config import stream_max_chars, stream_max_preamble_chars
+
+# Erwartete Felder der Modellantwort und der JSON-Typ ihres Werts
+RESPONSE_SCHEMA = {
+    "titel": str,
+    "SEO": str,
+    "Kurzbeschreibung": str,
+    "Verkaufstext": str,
+    "OE-Nummer": list,
+    "Quelle": list,
+    "kompatibilität": list,
+}
+REQUIRED_KEYS = ("titel", "SEO", "Verkaufstext", "kompatibilität")
+
+# Erstes Zeichen eines Werts -> JSON-Typ
+VALUE_TYPES = {'"': str, "[": list, "{": dict}
+COERCIBLE = (str, list)
+CLOSING = {"[": "]", "{": "}"}
+WHITESPACE = " \t\r\n"
+# Zeichen eines Literal-Werts (null, true, false, Zahlen); JsonRepair.coerce wandelt sie in den Schema-Typ um
+SCALAR_CHARS = set("nulltruefalse0123456789+-.eE")
+
+class SchemaViolation(ValueError):
+    def __init__(self, kind, message):
+        super().__init__(message)
+        self.kind = kind
+
+class ResponseAborted(Exception):
+    def __init__(self, reason, chars=0):
+        super().__init__(f"Response aborted after {chars} chars: {reason}")
+        self.reason = reason
+        self.chars = chars
+
+#Character-level validator for a streamed answer. It checks the top-level object against RESPONSE_SCHEMA while the
+#text arrives (broken syntax, objects as text values, a long preamble, runaway length) and raises SchemaViolation at the
+#first violation, so the request can be cancelled without waiting for the rest of the answer.
+#Everything parse_model_json repairs locally is let through: prose or fences around the object, null/number/boolean
+#values, unknown and duplicate keys.
+class IncrementalJsonValidator:
+    def __init__(self, schema=RESPONSE_SCHEMA, required=REQUIRED_KEYS, max_chars=stream_max_chars, max_preamble=stream_max_preamble_chars):
+        self.schema = schema
+        self.required = required
+        self.max_chars = max_chars
+        self.max_preamble = max_preamble
+        self.chunks = []
+        self.position = 0
+        self.state = "start"
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.key_chars = None
+        self.current_key = None
+        self.value_start = None
+        self.object_span = None
+        self.fields = {}
+
+    @property
+    def finished(self):
+        return self.state == "done"
+
+    #The function consumes the next piece of streamed text.
+    def feed(self, delta):
+        self.chunks.append(delta)
+        for char in delta:
+            self.__step(char)
+            self.position += 1
+        if self.max_chars and self.position > self.max_chars:
+            raise SchemaViolation("runaway", f"answer longer than {self.max_chars} chars")
+
+    #The function checks that the streamed answer is complete and returns it as a dict.
+    def finish(self):
+        if not self.finished:
+            raise SchemaViolation("incomplete", f"incomplete JSON (state {self.state})")
+        missing = [key for key in self.required if key not in self.fields]
+        if missing:
+            raise SchemaViolation("missing_keys", f"missing keys {missing}")
+        text = "".join(self.chunks)
+        return json.loads(text[self.object_span[0]:self.object_span[1]])
+
+    def __step(self, char):
+        if self.in_string:
+            if self.escape:
+                self.escape = False
+            elif char == "\\":
+                self.escape = True
+            elif char == '"':
+                self.in_string = False
+                if self.key_chars is not None:
+                    # Escapes wie \u00e4 im Schlüssel auflösen
+                    self.__key_done(json.loads('"' + "".join(self.key_chars) + '"'))
+                    return
+                if not self.stack:
+                    self.__value_done()
+                return
+            if self.key_chars is not None:
+                self.key_chars.append(char)
+            return
+
+        if self.state == "scalar":
+            if char in SCALAR_CHARS:
+                return
+            self.__value_done(self.position)
+            if char in WHITESPACE:
+                return
+
+        if self.stack:
+            # Innerhalb eines verschachtelten Werts nur Klammern und Strings verfolgen
+            if char == '"':
+                self.in_string = True
+            elif char in CLOSING:
+                self.stack.append(CLOSING[char])
+            elif char in "]}":
+                if char != self.stack.pop():
+                    raise SchemaViolation("syntax", f"mismatched '{char}' in '{self.current_key}'")
+                if not self.stack:
+                    self.__value_done()
+            return
+
+        if char in WHITESPACE:
+            return
+        state = self.state
+
+        if state == "start":
+            if char == "{":
+                self.state = "key"
+                self.object_span = (self.position, None)
+            elif self.position >= self.max_preamble:
+                raise SchemaViolation("not_json", f"no JSON object within the first {self.max_preamble} chars")
+        elif state == "key":
+            if char == '"':
+                self.in_string = True
+                self.key_chars = []
+            elif char == "}" and not self.fields:
+                self.__object_done()
+            else:
+                raise SchemaViolation("syntax", f"expected a key, got {char!r}")
+        elif state == "colon":
+            if char != ":":
+                raise SchemaViolation("syntax", f"expected ':' after '{self.current_key}', got {char!r}")
+            self.state = "value"
+        elif state == "value":
+            value_type = VALUE_TYPES.get(char)
+            expected = self.schema.get(self.current_key)
+            self.value_start = self.position
+            if value_type is None:
+                if char not in SCALAR_CHARS:
+                    raise SchemaViolation("syntax", f"invalid value for '{self.current_key}': {char!r}")
+                # Literal-Werte werden nach dem Empfang lokal umgewandelt (JsonRepair.coerce)
+                self.state = "scalar"
+                return
+            # String statt Liste (oder umgekehrt) und ein einzelnes Objekt statt einer Liste werden ebenfalls umgewandelt
+            if expected is str and value_type is dict:
+                raise SchemaViolation("wrong_type", f"'{self.current_key}' must be str, got {char!r}")
+            if char == '"':
+                self.in_string = True
+            else:
+                self.stack.append(CLOSING[char])
+        elif state == "comma":
+            if char == ",":
+                self.state = "key"
+            elif char == "}":
+                self.__object_done()
+            else:
+                raise SchemaViolation("syntax", f"expected ',' or '}}' after '{self.current_key}', got {char!r}")
+        # Text nach dem Objekt (state "done") wird ignoriert, JsonRepair schneidet ihn ab
+
+    # Unbekannte Schlüssel ignoriert coerce, bei doppelten gilt wie bei json.loads der letzte Wert
+    def __key_done(self, key):
+        self.key_chars = None
+        self.current_key = key
+        self.state = "colon"
+
+    def __object_done(self):
+        self.object_span = (self.object_span[0], self.position + 1)
+        self.state = "done"
+
+    def __value_done(self, end=None):
+        self.fields[self.current_key] = (self.value_start, self.position + 1 if end is None else end)
+        self.state = "comma"
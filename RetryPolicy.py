@@ -0,0 +1,161 @@
+import json
+import random
+import threading
+import time
+from configuration.configurate_logs import setup_logger
+from configuration.config import retry_policies, breaker_failure_threshold, breaker_reset_seconds
+from Metrics import get_metrics
+
+logger = setup_logger()
+
+# Fehlerklassen, die auf einen Ausfall beim Anbieter hindeuten und den Circuit Breaker füttern
+PROVIDER_ERRORS = ("server", "timeout", "connection")
+
+#The function maps an exception to an error class: rate_limit, timeout, connection, server, parse or client.
+def classify_error(error):
+    status = getattr(error, "status_code", None)
+    name = type(error).__name__
+    if status == 429:
+        return "rate_limit"
+    if "Timeout" in name or isinstance(error, TimeoutError):
+        return "timeout"
+    if "Connection" in name or isinstance(error, ConnectionError):
+        return "connection"
+    if status is not None and status >= 500:
+        return "server"
+    if name in ("RepairFailed", "ResponseAborted") or isinstance(error, json.JSONDecodeError):
+        return "parse"
+    if status is not None:
+        return "client"
+    return "other"
+
+#The function reads the Retry-After header of an API error (seconds), if present.
+def retry_after(error):
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except Exception:
+        return None
+
+class RetryPolicy:
+    def __init__(self, max_attempts, base_delay=1.0, max_delay=60.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    #The function returns the wait time before the next attempt: exponential back-off with full jitter,
+    #or the server's Retry-After value when it is larger.
+    def delay(self, attempt, server_hint=None):
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if server_hint:
+            delay = max(delay, min(server_hint, self.max_delay))
+        return delay
+
+#Circuit breaker shared by all workers. After breaker_failure_threshold provider failures in a row it opens and
+#every caller waits until breaker_reset_seconds have passed; then a single probe call decides whether it closes again.
+class CircuitBreaker:
+    def __init__(self, failure_threshold=breaker_failure_threshold, reset_seconds=breaker_reset_seconds):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.condition = threading.Condition()
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    #The function blocks while the breaker is open; in the half-open state only one probe call passes.
+    def before_call(self):
+        with self.condition:
+            while True:
+                if self.state == "closed":
+                    return
+                remaining = self.opened_at + self.reset_seconds - time.monotonic()
+                if remaining <= 0 and not self.probing:
+                    self.state = "half_open"
+                    self.probing = True
+                    logger.info("🔌 Circuit breaker half-open, sending a probe request")
+                    return
+                self.condition.wait(remaining if remaining > 0 else None)
+
+    def record_success(self):
+        with self.condition:
+            if self.state != "closed":
+                logger.info("🔌 Circuit breaker closed, provider is answering again")
+            self.state = "closed"
+            self.failures = 0
+            self.probing = False
+            self.condition.notify_all()
+
+    def record_failure(self):
+        with self.condition:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning(f"🔌 Circuit breaker OPEN after {self.failures} provider failure(s), "
+                                   f"pausing requests for {self.reset_seconds}s")
+                    get_metrics().inc("circuit_breaker_open_total")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.probing = False
+                self.condition.notify_all()
+
+    #The function releases a probe slot without a verdict (e.g. after a parse error).
+    def record_neutral(self):
+        with self.condition:
+            if self.state == "half_open":
+                self.probing = False
+                self.condition.notify_all()
+
+class RetryEngine:
+    def __init__(self, policies=None, breaker=None):
+        self.policies = {kind: RetryPolicy(**settings) for kind, settings in (policies or retry_policies).items()}
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = get_metrics()
+
+    #The function calls fn(*args) until it succeeds or the policy of the error class gives up, then re-raises.
+    #before_attempt runs before every attempt (e.g. the rate limiter); on_rate_limited receives the Retry-After hint.
+    def call(self, fn, *args, before_attempt=None, on_rate_limited=None, on_success=None, **kwargs):
+        attempt = 0
+        while True:
+            attempt += 1
+            self.breaker.before_call()
+            if before_attempt:
+                before_attempt()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                kind = classify_error(e)
+                if kind in PROVIDER_ERRORS:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_neutral()
+
+                policy = self.policies.get(kind) or self.policies["other"]
+                if attempt >= policy.max_attempts:
+                    raise
+                hint = retry_after(e)
+                if kind == "rate_limit" and on_rate_limited:
+                    # Der Rate Limiter pausiert alle Worker selbst (before_attempt wartet)
+                    delay = on_rate_limited(hint) or 0.0
+                else:
+                    delay = policy.delay(attempt, hint)
+                    time.sleep(delay)
+                self.metrics.inc("retries_total", reason=kind)
+                logger.warning(f"🔁 {kind} error ({e}), attempt {attempt}/{policy.max_attempts}, retrying in {delay:.1f}s")
+                continue
+
+            self.breaker.record_success()
+            if on_success:
+                on_success()
+            return result
+
+_engine = None
+_engine_lock = threading.Lock()
+
+#The function returns the process-wide retry engine (one circuit breaker for all callers), creating it on first use.
+def get_retry_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = RetryEngine()
+        return _engine
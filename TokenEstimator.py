@@ -0,0 +1,115 @@
+import json
+import math
+import os
+import threading
+from configuration.configurate_logs import setup_logger
+from configuration.config import token_calibration_path, token_default_chars_per_token, model_prices, batch_price_factor
+from configuration.config import rate_limit_rpm, rate_limit_tpm
+
+logger = setup_logger()
+
+# Aufschlag pro Nachricht (Rollen- und Trennzeichen-Tokens)
+MESSAGE_OVERHEAD = 4
+
+#Local token estimator for the expanded prompts. It starts from token_default_chars_per_token and is calibrated per API
+#from the usage of answered requests (exponential moving average of input tokens per prompt character, output tokens
+#and cached share). The calibration is stored in token_calibration_path, so every run starts from the last one.
+class TokenEstimator:
+    def __init__(self, path=token_calibration_path, alpha=0.1):
+        self.path = path
+        self.alpha = alpha
+        self.lock = threading.Lock()
+        self.calibration = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.calibration = json.load(f)
+            except Exception as e:
+                logger.error(f"❌ Token calibration could not be read: {e}")
+
+    def __entry(self, api):
+        return self.calibration.get(api) or {}
+
+    #The function estimates the input tokens of one request from its message texts.
+    def input_tokens(self, *texts, api="chat"):
+        tokens_per_char = self.__entry(api).get("tokens_per_char") or 1.0 / token_default_chars_per_token
+        chars = sum(len(text) for text in texts if text)
+        return math.ceil(chars * tokens_per_char) + MESSAGE_OVERHEAD * len(texts)
+
+    #The function returns the expected output tokens of one request (observed average, else half of the maximum).
+    def output_tokens(self, max_output_tokens, api="chat"):
+        observed = self.__entry(api).get("output_tokens")
+        if observed:
+            return min(math.ceil(observed), max_output_tokens)
+        return max_output_tokens // 2
+
+    #The function returns the observed share of cached input tokens.
+    def cached_share(self, api="chat"):
+        return self.__entry(api).get("cached_share") or 0.0
+
+    #The function feeds the usage of one answered request into the calibration; chars=None calibrates only the output.
+    def observe(self, api, input_tokens, cached_tokens, output_tokens, chars=None):
+        with self.lock:
+            entry = self.calibration.setdefault(api, {"samples": 0})
+            updates = {"output_tokens": output_tokens}
+            if input_tokens:
+                updates["cached_share"] = cached_tokens / input_tokens
+                if chars:
+                    updates["tokens_per_char"] = input_tokens / chars
+            for key, value in updates.items():
+                previous = entry.get(key)
+                entry[key] = value if previous is None else previous + self.alpha * (value - previous)
+            entry["samples"] += 1
+
+    #The function writes the calibration to disk (atomic replace).
+    def save(self):
+        if not self.path or not self.calibration:
+            return
+        try:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            with self.lock:
+                payload = json.dumps(self.calibration, indent=2)
+            with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(self.path + ".tmp", self.path)
+        except Exception as e:
+            logger.error(f"❌ Token calibration could not be saved: {e}")
+
+    #The function returns and logs a cost/time forecast for `requests` requests with the estimated token totals.
+    #Batch requests are priced with batch_price_factor and finish within the completion window;
+    #synchronous requests take as long as the RPM/TPM limits allow.
+    def forecast(self, label, model, requests, input_tokens, output_tokens, max_output_tokens=None, api="chat", batch=False):
+        prices = model_prices.get(model) or {}
+        cached_tokens = input_tokens * self.cached_share(api)
+        cost = (
+            (input_tokens - cached_tokens) * prices.get("input", 0.0)
+            + cached_tokens * prices.get("cached", 0.0)
+            + output_tokens * prices.get("output", 0.0)
+        ) / 1_000_000
+        if batch:
+            cost *= batch_price_factor
+            duration = "≤ 24h"
+        else:
+            # Für das TPM-Limit zählt die maximale Ausgabe, nicht die erwartete
+            limit_tokens = input_tokens + requests * (max_output_tokens or 0)
+            minutes = max(requests / rate_limit_rpm, limit_tokens / rate_limit_tpm)
+            duration = f"~{minutes:.0f} min" if minutes >= 1 else f"~{minutes * 60:.0f} s"
+
+        forecast = {"requests": requests, "input_tokens": input_tokens, "output_tokens": output_tokens,
+                    "cost_usd": round(cost, 4), "duration": duration}
+        logger.info(f"📊 Forecast {label}: {requests} request(s), ~{input_tokens} input / ~{output_tokens} output tokens, "
+                    f"~${cost:.2f}{' (unknown model price)' if not prices else ''}, {duration}")
+        return forecast
+
+_estimator = None
+_estimator_lock = threading.Lock()
+
+#The function returns the process-wide token estimator, creating it on first use.
+def get_token_estimator():
+    global _estimator
+    with _estimator_lock:
+        if _estimator is None:
+            _estimator = TokenEstimator()
+        return _estimator
@@ -0,0 +1,79 @@
+# Micro-benchmark: HtmlRenderer vs. the former string concatenation in OpencartProductController.
+# Usage: python benchmarks/bench_html_renderer.py [rows] [repeat]
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from HtmlRenderer import render_description
+
+#The function reproduces the previous rendering (+= per row, uncompiled lookbehind regex) for comparison.
+def legacy_render(old_description, response_json):
+    description_html = re.sub(r"(?<!<br>)(?<=\.)\s+", "<br/>", response_json.get("Verkaufstext", ""))
+    oenummer = ", ".join(response_json.get("OE-Nummer", []))
+    if oenummer:
+        oenummer = "<div class='item-oe-nummer'>OE-Nummer: " + oenummer + "</div>"
+
+    html = """
+            <table class='item-compability-table'>
+                <tr>
+                    <th>Marke</th>
+                    <th>Modell</th>
+                    <th>Baujahr</th>
+                    <th>Motorvarianten</th>
+                    <th>Bemerkung</th>
+                </tr>
+            """
+    for item in response_json.get("kompatibilität", []):
+        html += f"""
+        <tr>
+            <td>{item.get('marke', '')}</td>
+            <td>{item.get('modell', '')}</td>
+            <td>{item.get('baujahr_von', '')} - {item.get('baujahr_bis', '')}</td>
+            <td>{'<br>'.join(item.get('motorvarianten', []))}</td>
+            <td>{item.get('bemerkung', '')}</td>
+        </tr>
+            """
+    html += "</table>"
+
+    block1 = f"<div class='item-desc-text'>{description_html}</div>"
+    block2 = f"<div class='item-compability-block'><h4>Kompatibilitätsliste (ohne Gewähr)</h4>{html}</div>"
+    return f"<div class='item-desc-text'>{old_description}</div> <div class='addedTextAi'>{block1}{oenummer}{block2}</div>".strip()
+
+def make_response(rows, special_chars=False):
+    return {
+        "titel": "Katalysator Peugeot Expert 2.0 HDi",
+        "SEO": "Katalysator Partikelfilter Peugeot Expert",
+        "Kurzbeschreibung": "Original Katalysator mit Partikelfilter",
+        "Verkaufstext": "Hochwertiger Katalysator. Passend für viele Modelle. Geprüfte Qualität & schneller Versand. " * 4,
+        "OE-Nummer": ["9808561380", "1731TL", "1731SW"],
+        "kompatibilität": [
+            {
+                "marke": "Peugeot",
+                "modell": f"Expert III <Typ {index}>" if special_chars else f"Expert III Typ {index}",
+                "baujahr_von": "2016",
+                "baujahr_bis": "heute",
+                "motorvarianten": ["2.0 BlueHDi 120", "2.0 BlueHDi 150", "1.6 BlueHDi 95"],
+                "bemerkung": "nur mit DPF & AdBlue" if special_chars else "nur mit DPF",
+            }
+            for index in range(rows)
+        ],
+    }
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    old_description = "<p>Gebrauchtteil, geprüft.</p>"
+
+    print(f"kompatibilität rows: {rows}")
+    for special_chars in (False, True):
+        response = make_response(rows, special_chars)
+        legacy = min(timeit.repeat(lambda: legacy_render(old_description, response), number=repeat, repeat=3)) / repeat
+        current = min(timeit.repeat(lambda: render_description(old_description, response), number=repeat, repeat=3)) / repeat
+
+        label = "with & < > (escaped)" if special_chars else "plain text"
+        print(f"{label}:")
+        print(f"  legacy (no escaping) : {legacy * 1e6:10.1f} µs/product")
+        print(f"  renderer             : {current * 1e6:10.1f} µs/product  ({current / rows * 1e6:.2f} µs/row)")
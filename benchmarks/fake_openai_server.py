@@ -0,0 +1,312 @@
+# Local stand-in for the OpenAI Responses, Chat Completions, Files and Batches endpoints.
+# It answers with synthetic product descriptions after a configurable latency and can inject 429 and 5xx errors
+# as well as malformed answers. Responses requests with "stream": true are answered with server-sent events.
+# Usage: python benchmarks/fake_openai_server.py --port 8765 --latency-ms 800 --rate-limit-rate 0.05
+import argparse
+import email
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+#The function builds a synthetic model answer in the JSON format requested by the shop prompt.
+def fake_description(seed_text, compatibility_rows=12):
+    name = seed_text.strip()[-80:]
+    return {
+        "titel": f"Ersatzteil {name}",
+        "SEO": f"{name} günstig kaufen",
+        "Kurzbeschreibung": "Geprüftes Ersatzteil mit schnellem Versand",
+        "Verkaufstext": "Hochwertiges Ersatzteil. Passgenau und geprüft. Schneller Versand aus Deutschland.",
+        "OE-Nummer": ["9808561380", "1731TL"],
+        "Quelle": ["autodoc.de"],
+        "kompatibilität": [
+            {
+                "marke": "Peugeot",
+                "modell": f"Expert III Typ {index}",
+                "baujahr_von": "2016",
+                "baujahr_bis": "heute",
+                "motorvarianten": ["2.0 BlueHDi 120", "2.0 BlueHDi 150"],
+                "bemerkung": "",
+            }
+            for index in range(compatibility_rows)
+        ],
+    }
+
+def usage(prompt_text, output_text, chat=False):
+    input_tokens = max(1, len(prompt_text) // 4)
+    output_tokens = max(1, len(output_text) // 4)
+    cached = input_tokens // 2
+    if chat:
+        return {
+            "prompt_tokens": input_tokens, "completion_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens, "prompt_tokens_details": {"cached_tokens": cached},
+        }
+    return {
+        "input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens,
+        "input_tokens_details": {"cached_tokens": cached}, "output_tokens_details": {"reasoning_tokens": 0},
+    }
+
+def chat_completion(body, compatibility_rows):
+    prompt_text = "\n".join(str(message.get("content", "")) for message in body.get("messages", []))
+    text = json.dumps(fake_description(prompt_text, compatibility_rows), ensure_ascii=False)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}", "object": "chat.completion", "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}],
+        "usage": usage(prompt_text, text, chat=True),
+    }
+
+class FakeOpenAIState:
+    def __init__(self, latency_ms=500, jitter_ms=200, rate_limit_rate=0.0, error_rate=0.0,
+                 batch_seconds=3.0, batch_error_rate=0.0, compatibility_rows=12, malformed_rate=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.batch_seconds = batch_seconds
+        self.batch_error_rate = batch_error_rate
+        self.compatibility_rows = compatibility_rows
+        self.malformed_rate = malformed_rate
+        self.lock = threading.Lock()
+        self.files = {}
+        self.batches = {}
+        self.requests = 0
+        self.aborted_streams = 0
+
+    def sleep(self):
+        delay = max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000.0
+        time.sleep(delay)
+
+    #The function turns a batch input file into an output (and error) file once the batch is due.
+    #A cancelled batch only answers the first half of its requests (the part finished before the cancel).
+    def finish_batch(self, batch, status="completed"):
+        lines = self.files[batch["input_file_id"]]["content"].decode("utf-8").splitlines()
+        if status == "cancelled":
+            lines = lines[:len(lines) // 2]
+        output, errors = [], []
+        for line in lines:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            if random.random() < self.batch_error_rate:
+                errors.append({"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": request["custom_id"], "response": None,
+                               "error": {"code": "server_error", "message": "Injected batch item failure"}})
+                continue
+            body = chat_completion(request["body"], self.compatibility_rows)
+            output.append({"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": request["custom_id"],
+                           "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": body}, "error": None})
+
+        batch["output_file_id"] = self.add_file("\n".join(json.dumps(o, ensure_ascii=False) for o in output).encode("utf-8") + b"\n", "batch_output")
+        if errors:
+            batch["error_file_id"] = self.add_file("\n".join(json.dumps(e) for e in errors).encode("utf-8") + b"\n", "batch_output")
+        batch["status"] = status
+        batch["completed_at"] = int(time.time())
+        batch["request_counts"] = {"total": len(output) + len(errors), "completed": len(output), "failed": len(errors)}
+
+    def add_file(self, content, purpose, filename="upload.jsonl"):
+        file_id = f"file-{uuid.uuid4().hex}"
+        self.files[file_id] = {"content": content, "purpose": purpose, "filename": filename, "created_at": int(time.time())}
+        return file_id
+
+    def file_object(self, file_id):
+        entry = self.files[file_id]
+        return {"id": file_id, "object": "file", "bytes": len(entry["content"]), "created_at": entry["created_at"],
+                "filename": entry["filename"], "purpose": entry["purpose"], "status": "processed"}
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    state = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    #The function extracts the uploaded file from a multipart/form-data body.
+    def uploaded_file(self, body):
+        header = f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode("utf-8")
+        message = email.message_from_bytes(header + body)
+        for part in message.walk():
+            if part.get_filename():
+                return part.get_payload(decode=True)
+        return body
+
+    #The function injects the configured 429 / 5xx failures; returns True if the request was answered with an error.
+    def inject_failure(self):
+        roll = random.random()
+        if roll < self.state.rate_limit_rate:
+            self.send_json(429, {"error": {"message": "Rate limit reached (injected)", "type": "requests", "code": "rate_limit_exceeded"}},
+                           {"retry-after": "1"})
+            return True
+        if roll < self.state.rate_limit_rate + self.state.error_rate:
+            self.send_json(500, {"error": {"message": "Internal server error (injected)", "type": "server_error", "code": None}})
+            return True
+        return False
+
+    #The function sends a Responses answer as server-sent events; the latency is spread over the text deltas.
+    #A client that closes the connection early ends the stream (BrokenPipeError).
+    def stream_response(self, response, text, chunk_chars=40):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        chunks = [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)] or [""]
+        delay = max(0.0, random.gauss(self.state.latency_ms, self.state.jitter_ms)) / 1000.0 / len(chunks)
+        events = [{"type": "response.created", "response": dict(response, status="in_progress", output=[])}]
+        events += [{"type": "response.output_text.delta", "item_id": response["output"][0]["id"], "output_index": 0,
+                    "content_index": 0, "delta": chunk} for chunk in chunks]
+        events.append({"type": "response.completed", "response": response})
+        try:
+            for sequence_number, event in enumerate(events):
+                event["sequence_number"] = sequence_number
+                self.wfile.write(f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                if event["type"] == "response.output_text.delta":
+                    time.sleep(delay)
+        except (BrokenPipeError, ConnectionResetError):
+            with self.state.lock:
+                self.state.aborted_streams += 1
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        body = self.read_body()
+        with self.state.lock:
+            self.state.requests += 1
+
+        if path.endswith("/responses"):
+            if self.inject_failure():
+                return
+            request = json.loads(body or b"{}")
+            prompt_text = f"{request.get('instructions') or ''}\n{request.get('input', '')}"
+            text = json.dumps(fake_description(str(request.get("input", "")), self.state.compatibility_rows), ensure_ascii=False)
+            if random.random() < self.state.malformed_rate:
+                text = "Leider konnte ich zu diesem Artikel keine verlässlichen Informationen finden. " * 40
+            response = {
+                "id": f"resp_{uuid.uuid4().hex}", "object": "response", "created_at": int(time.time()),
+                "model": request.get("model", "fake"), "status": "completed", "parallel_tool_calls": True,
+                "tool_choice": "auto", "tools": request.get("tools", []),
+                "output": [{"type": "message", "id": f"msg_{uuid.uuid4().hex}", "status": "completed", "role": "assistant",
+                            "content": [{"type": "output_text", "text": text, "annotations": []}]}],
+                "usage": usage(prompt_text, text),
+            }
+            if request.get("stream"):
+                self.stream_response(response, text)
+            else:
+                self.state.sleep()
+                self.send_json(200, response)
+        elif path.endswith("/chat/completions"):
+            if self.inject_failure():
+                return
+            self.state.sleep()
+            self.send_json(200, chat_completion(json.loads(body or b"{}"), self.state.compatibility_rows))
+        elif path.endswith("/files"):
+            content = self.uploaded_file(body)
+            with self.state.lock:
+                file_id = self.state.add_file(content, "batch")
+            self.send_json(200, self.state.file_object(file_id))
+        elif re.search(r"/batches/([^/]+)/cancel$", path):
+            with self.state.lock:
+                batch = self.state.batches.get(path.split("/")[-2])
+                if batch and batch["status"] in ("validating", "in_progress"):
+                    batch["status"] = "cancelling"
+            if not batch:
+                self.send_json(404, {"error": {"message": "No such batch"}})
+                return
+            self.send_json(200, {k: v for k, v in batch.items() if k != "due_at"})
+        elif path.endswith("/batches"):
+            request = json.loads(body or b"{}")
+            batch_id = f"batch_{uuid.uuid4().hex}"
+            batch = {
+                "id": batch_id, "object": "batch", "endpoint": request.get("endpoint"), "input_file_id": request.get("input_file_id"),
+                "completion_window": request.get("completion_window", "24h"), "status": "in_progress",
+                "created_at": int(time.time()), "output_file_id": None, "error_file_id": None,
+                "due_at": time.time() + self.state.batch_seconds,
+            }
+            with self.state.lock:
+                self.state.batches[batch_id] = batch
+            self.send_json(200, {k: v for k, v in batch.items() if k != "due_at"})
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown endpoint {path}"}})
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        batch_match = re.search(r"/batches/([^/]+)$", path)
+        content_match = re.search(r"/files/([^/]+)/content$", path)
+
+        if batch_match:
+            with self.state.lock:
+                batch = self.state.batches.get(batch_match.group(1))
+                if batch and batch["status"] == "in_progress" and time.time() >= batch["due_at"]:
+                    self.state.finish_batch(batch)
+                elif batch and batch["status"] == "cancelling":
+                    self.state.finish_batch(batch, "cancelled")
+            if not batch:
+                self.send_json(404, {"error": {"message": "No such batch"}})
+                return
+            self.send_json(200, {k: v for k, v in batch.items() if k != "due_at"})
+        elif content_match:
+            entry = self.state.files.get(content_match.group(1))
+            if not entry:
+                self.send_json(404, {"error": {"message": "No such file"}})
+                return
+            content = entry["content"]
+            status = 200
+            range_match = re.match(r"bytes=(\d+)-", self.headers.get("Range") or "")
+            if range_match:
+                content = content[int(range_match.group(1)):]
+                status = 206
+            self.send_response(status)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown endpoint {path}"}})
+
+#The function starts the fake server in a background thread and returns (server, base_url).
+def start_server(state, port=0):
+    handler = type("BoundFakeOpenAIHandler", (FakeOpenAIHandler,), {"state": state})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI server for benchmarks")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=500)
+    parser.add_argument("--jitter-ms", type=float, default=200)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--batch-seconds", type=float, default=3.0)
+    parser.add_argument("--batch-error-rate", type=float, default=0.0)
+    parser.add_argument("--compatibility-rows", type=int, default=12)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    state = FakeOpenAIState(args.latency_ms, args.jitter_ms, args.rate_limit_rate, args.error_rate,
+                            args.batch_seconds, args.batch_error_rate, args.compatibility_rows, args.malformed_rate)
+    server, base_url = start_server(state, args.port)
+    print(f"Fake OpenAI server listening on {base_url}  (export OPENAI_BASE_URL={base_url})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,55 @@
+-- Minimal OpenCart fixture for benchmarks/run_benchmark.py.
+-- Only the tables and columns read or written by OpenCartModul.py; load it into a local, throw-away MySQL/MariaDB database.
+DROP TABLE IF EXISTS oc_language;
+CREATE TABLE oc_language (
+    language_id INT NOT NULL PRIMARY KEY,
+    name VARCHAR(32) NOT NULL
+);
+
+DROP TABLE IF EXISTS oc_product;
+CREATE TABLE oc_product (
+    product_id INT NOT NULL PRIMARY KEY,
+    sku VARCHAR(64) NOT NULL DEFAULT '',
+    upc VARCHAR(12) NOT NULL DEFAULT '',
+    ean VARCHAR(14) NOT NULL DEFAULT '',
+    quantity INT NOT NULL DEFAULT 0,
+    price DECIMAL(15,4) NOT NULL DEFAULT 0,
+    status TINYINT(1) NOT NULL DEFAULT 0,
+    ebay_user INT NOT NULL DEFAULT 0,
+    ebay_updatetime DATETIME NULL,
+    date_added DATETIME NULL,
+    chatgpt_state TINYINT(1) NULL,
+    chatgpt_calltime DATETIME NULL,
+    chatgpt_lease_owner VARCHAR(64) NULL,
+    chatgpt_lease_until DATETIME NULL,
+    chatgpt_fingerprint CHAR(64) NULL
+);
+CREATE INDEX idx_product_chatgpt_backlog ON oc_product (chatgpt_state, ebay_updatetime, product_id);
+
+DROP TABLE IF EXISTS oc_product_description;
+CREATE TABLE oc_product_description (
+    product_id INT NOT NULL,
+    language_id INT NOT NULL,
+    name VARCHAR(255) NOT NULL,
+    description MEDIUMTEXT NOT NULL,
+    meta_title VARCHAR(255) NOT NULL DEFAULT '',
+    meta_keyword VARCHAR(255) NOT NULL DEFAULT '',
+    tag TEXT NOT NULL,
+    PRIMARY KEY (product_id, language_id)
+);
+
+DROP TABLE IF EXISTS oc_kb_ebay_profile_products;
+CREATE TABLE oc_kb_ebay_profile_products (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    id_product INT NOT NULL,
+    ebay_status VARCHAR(32) NOT NULL DEFAULT 'Active',
+    status VARCHAR(32) NOT NULL DEFAULT '',
+    revise CHAR(1) NOT NULL DEFAULT '0',
+    KEY (id_product)
+);
+
+DROP TABLE IF EXISTS oc_prompts_ai;
+CREATE TABLE oc_prompts_ai (
+    prompt_typ INT NOT NULL PRIMARY KEY,
+    prompt_text TEXT NOT NULL
+);
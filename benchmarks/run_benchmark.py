@@ -0,0 +1,247 @@
+# End-to-end benchmark of the synchronous path (mode=0), the batch path (mode=1) and the result application
+# against benchmarks/fake_openai_server.py and a local MySQL/MariaDB fixture database (benchmarks/fixture_schema.sql).
+# Every path runs in its own subprocess and working directory, so peak RSS, the response cache and the
+# batch registry are measured per path.
+#
+# Usage:
+#   DB_HOST=127.0.0.1 DB_NAME=bench DB_USER=bench DB_PASSWORD=bench \
+#   python benchmarks/run_benchmark.py --items 500 --latency-ms 800 --workers 8 --paths sync,batch,apply
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_openai_server import FakeOpenAIState, start_server, chat_completion
+
+LOCAL_HOSTS = ("127.0.0.1", "localhost", "::1")
+PROMPT = ("Du bist ein Experte für Kfz-Ersatzteile. Erstelle für den Artikel {name} eine Verkaufsbeschreibung "
+          "und antworte nur mit JSON (titel, SEO, Kurzbeschreibung, Verkaufstext, OE-Nummer, Quelle, kompatibilität).")
+PARTS = ["Bremssattel", "Querlenker", "Lichtmaschine", "Turbolader", "Wasserpumpe", "Zündspule", "Anlasser", "Kühler"]
+BRANDS = ["Peugeot", "Citroen", "VW", "Audi", "BMW", "Opel", "Ford", "Renault"]
+
+class StageTimer:
+    def __init__(self):
+        self.samples = {}
+
+    #The function replaces owner.name with a wrapper that records the duration of every call under stage.
+    def wrap(self, owner, name, stage):
+        original = getattr(owner, name)
+        samples = self.samples.setdefault(stage, [])
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                samples.append(time.perf_counter() - started)
+
+        setattr(owner, name, timed)
+
+    def summary(self):
+        result = {}
+        for stage, samples in self.samples.items():
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            result[stage] = {
+                "calls": len(ordered),
+                "p50_ms": ordered[len(ordered) // 2] * 1000,
+                "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+                "total_s": sum(ordered),
+            }
+        return result
+
+#The function connects to the fixture database; the benchmark refuses to touch anything but a local database.
+def connect():
+    import pymysql
+    from configuration.config import host, user, password, db_name, db_port
+
+    if host not in LOCAL_HOSTS:
+        sys.exit(f"❌ Refusing to run against non-local database host '{host}'. Set DB_HOST=127.0.0.1 (and DB_NAME, DB_USER, DB_PASSWORD).")
+    return pymysql.connect(host=host, user=user, password=password, database=db_name, port=db_port,
+                           charset="utf8mb4", autocommit=True)
+
+#The function creates the fixture tables and inserts `items` synthetic products (every 10th one a duplicate part number).
+def seed(items, seed_value=42):
+    rnd = random.Random(seed_value)
+    connection = connect()
+    with connection.cursor() as cursor:
+        with open(os.path.join(BENCH_DIR, "fixture_schema.sql"), encoding="utf-8") as schema:
+            for statement in schema.read().split(";"):
+                statement = "\n".join(line for line in statement.splitlines() if not line.startswith("--")).strip()
+                if statement:
+                    cursor.execute(statement)
+
+        cursor.execute("INSERT INTO oc_language (language_id, name) VALUES (1, 'English'), (2, 'German')")
+        cursor.execute("INSERT INTO oc_prompts_ai (prompt_typ, prompt_text) VALUES (1, %s)", (PROMPT,))
+
+        products, descriptions, profiles = [], [], []
+        for product_id in range(1, items + 1):
+            part_id = product_id - 1 if product_id % 10 == 0 else product_id
+            name = f"{rnd.choice(PARTS)} {rnd.choice(BRANDS)} {part_id:06d}"
+            updatetime = None if product_id % 7 == 0 else f"2025-01-{1 + product_id % 28:02d} 12:00:00"
+            products.append((product_id, f"SKU{part_id:06d}", f"{part_id:012d}", "", 1 + product_id % 5, 19.99, 1, 1, updatetime))
+            descriptions.append((product_id, 2, name, f"<p>Originalbeschreibung {name}</p>", "", "", ""))
+            profiles.append((product_id, "Active"))
+
+        cursor.executemany(
+            "INSERT INTO oc_product (product_id, sku, upc, ean, quantity, price, status, ebay_user, ebay_updatetime) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)", products)
+        cursor.executemany(
+            "INSERT INTO oc_product_description (product_id, language_id, name, description, meta_title, meta_keyword, tag) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s)", descriptions)
+        cursor.executemany("INSERT INTO oc_kb_ebay_profile_products (id_product, ebay_status) VALUES (%s, %s)", profiles)
+    connection.close()
+
+#The function puts every product back into the unprocessed backlog before the next path runs.
+def reset():
+    connection = connect()
+    with connection.cursor() as cursor:
+        cursor.execute("UPDATE oc_product SET chatgpt_state = NULL, chatgpt_calltime = NULL, chatgpt_fingerprint = NULL, "
+                       "chatgpt_lease_owner = NULL, chatgpt_lease_until = NULL")
+        cursor.execute("UPDATE oc_product_description SET description = CONCAT('<p>Originalbeschreibung ', name, '</p>'), "
+                       "meta_title = '', meta_keyword = '', tag = ''")
+        cursor.execute("UPDATE oc_kb_ebay_profile_products SET status = '', revise = '0'")
+    connection.close()
+
+#The function writes a batch output file with one synthetic answer per product, as the Batch API would return it.
+def write_batch_output(path, items):
+    connection = connect()
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT product_id, name FROM oc_product_description WHERE language_id = 2 ORDER BY product_id LIMIT %s", (items,))
+        rows = cursor.fetchall()
+    connection.close()
+
+    with open(path, "w", encoding="utf-8") as output:
+        for product_id, name in rows:
+            body = chat_completion({"model": "fake", "messages": [{"role": "user", "content": name}]}, 12)
+            line = {"id": f"batch_req_{product_id}", "custom_id": f"product-id-{product_id}",
+                    "response": {"status_code": 200, "body": body}, "error": None}
+            output.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+#The function runs one path inside the child process and prints its measurements as a single JSON line.
+def run_child(path, items, workers, output_file):
+    from ChatgptAiManager import ChatgptAiManager
+    from BatchModule import BatchModule
+    from OpenCartModul import OpencartProductController
+    from JsonParser import JsonParser
+    from MainController import MainController
+
+    timer = StageTimer()
+    timer.wrap(ChatgptAiManager, "call_itemdesc_with_browsing", "api_call")
+    timer.wrap(OpencartProductController, "UpdateItemDescAndSeo", "db_write")
+    timer.wrap(OpencartProductController, "UpdateItemsBulk", "db_bulk_write")
+    timer.wrap(BatchModule, "create_input_files", "batch_build")
+    timer.wrap(BatchModule, "submit_batch_jobs", "batch_submit")
+    timer.wrap(JsonParser, "process_batch_results", "batch_apply")
+
+    controller = MainController()
+    started = time.perf_counter()
+    if path == "sync":
+        controller.process_all(mode=0, limit=items, workers=workers)
+    elif path == "batch":
+        controller.batch_poller.base_delay = 1
+        controller.process_all(mode=1, limit=items)
+    elif path == "apply":
+        with open(output_file, encoding="utf-8") as lines:
+            controller.json_parser.process_batch_results(lines)
+    elapsed = time.perf_counter() - started
+
+    print(json.dumps({
+        "path": path,
+        "items": items,
+        "elapsed_s": elapsed,
+        "items_per_s": items / elapsed if elapsed else 0.0,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "stages": timer.summary(),
+    }))
+
+def count_processed():
+    connection = connect()
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM oc_product WHERE chatgpt_state = 1")
+        processed = cursor.fetchone()[0]
+    connection.close()
+    return processed
+
+def print_table(results):
+    print()
+    print(f"{'path':<8}{'items':>7}{'done':>7}{'elapsed s':>11}{'items/s':>10}{'peak RSS MB':>13}")
+    for result in results:
+        print(f"{result['path']:<8}{result['items']:>7}{result['processed']:>7}{result['elapsed_s']:>11.2f}"
+              f"{result['items_per_s']:>10.2f}{result['peak_rss_mb']:>13.1f}")
+
+    print()
+    print(f"{'path':<8}{'stage':<16}{'calls':>7}{'p50 ms':>10}{'p95 ms':>10}{'total s':>10}")
+    for result in results:
+        for stage, values in result["stages"].items():
+            print(f"{result['path']:<8}{stage:<16}{values['calls']:>7}{values['p50_ms']:>10.1f}"
+                  f"{values['p95_ms']:>10.1f}{values['total_s']:>10.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark against a fake OpenAI server and a local fixture database")
+    parser.add_argument("--items", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--paths", default="sync,batch,apply")
+    parser.add_argument("--latency-ms", type=float, default=500)
+    parser.add_argument("--jitter-ms", type=float, default=200)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--batch-seconds", type=float, default=3.0)
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--output-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.items, args.workers, args.output_file)
+        return
+
+    connect().close()
+    state = FakeOpenAIState(args.latency_ms, args.jitter_ms, args.rate_limit_rate, args.error_rate, args.batch_seconds)
+    server, base_url = start_server(state)
+    env = dict(os.environ, OPENAI_BASE_URL=base_url, OPENAI_API_KEY="sk-benchmark", PYTHONPATH=REPO_DIR)
+
+    print(f"🌱 Seeding {args.items} products ...")
+    seed(args.items)
+
+    results = []
+    for path in [p.strip() for p in args.paths.split(",") if p.strip()]:
+        reset()
+        with tempfile.TemporaryDirectory(prefix=f"bench_{path}_") as workdir:
+            output_file = os.path.join(workdir, "batch_output.jsonl")
+            if path == "apply":
+                write_batch_output(output_file, args.items)
+
+            print(f"▶️ Running path '{path}' ...")
+            command = [sys.executable, os.path.abspath(__file__), "--child", path, "--items", str(args.items),
+                       "--workers", str(args.workers), "--output-file", output_file]
+            completed = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True)
+            if completed.returncode != 0:
+                print(f"❌ Path '{path}' failed:\n{completed.stderr[-4000:]}")
+                continue
+
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            result["processed"] = count_processed()
+            results.append(result)
+
+    server.shutdown()
+    print_table(results)
+    print(f"\nFake server requests: {state.requests}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
+
+if __name__ == "__main__":
+    main()
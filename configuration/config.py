@@ -1,4 +1,126 @@
-host = '145.223.80.85'     
-db_name = 'test_owk_kfz'   
-user = 'litvinsergej4756'  
-password = 'eUHgyJJGWoVioLU0KYRq'  
\ No newline at end of file
+import os
+import socket
+
+# DB_* environment variables override the defaults (e.g. benchmarks against a local fixture database)
+host = os.getenv("DB_HOST", '145.223.80.85')
+db_name = os.getenv("DB_NAME", 'test_owk_kfz')
+user = os.getenv("DB_USER", 'litvinsergej4756')
+password = os.getenv("DB_PASSWORD", 'eUHgyJJGWoVioLU0KYRq')
+
+# Concurrent synchronous mode (mode=0)
+sync_workers = 4
+rate_limit_rpm = 60
+rate_limit_tpm = 200000
+
+# MySQL connection pool
+db_port = int(os.getenv("DB_PORT", 3306))
+db_pool_min = 1
+db_pool_max = 8
+db_pool_timeout = 30
+db_pool_ping_interval = 30
+
+# Bulk application of batch results: parser threads decode and render the output lines, writer threads apply
+# bulk_chunk_size results per transaction (at most db_pool_max connections). The queues between the stages are
+# bounded (2 x workers), so a slow database slows the download instead of filling memory.
+bulk_chunk_size = 200
+apply_parse_workers = 4
+apply_parse_chunk_lines = 100
+apply_db_writers = 4
+
+# Batch sharding (API limit: 50 000 requests / 200 MB per input file)
+batch_max_requests = 5000
+batch_max_bytes = 190 * 1024 * 1024
+batch_upload_workers = 4
+
+# Batch job registry and poller
+batch_registry_path = "batch_files/batch_registry.sqlite"
+batch_poll_base_delay = 30
+batch_poll_max_delay = 900
+batch_wait_minutes = 20
+
+# On-disk response cache
+response_cache_path = "cache/response_cache.sqlite"
+response_cache_ttl_days = 30
+response_cache_max_entries = 50000
+
+# Keyset-paginated product fetch
+fetch_page_size = 500
+
+# Metrics export (Prometheus textfile + per-run JSON summary)
+metrics_prefix = "chatgpt_pipeline"
+metrics_textfile_path = "metrics/chatgpt_pipeline.prom"
+metrics_summary_dir = "metrics/runs"
+
+# Logging (LOG_LEVEL=DEBUG also writes every response payload)
+log_level = os.getenv("LOG_LEVEL", "INFO")
+log_retention_days = 5
+log_jsonl = True
+# Share of response payloads logged at INFO level (0.0 = none, 1.0 = all)
+log_payload_sample_rate = 0.0
+
+# Streaming Responses calls in sync mode (abort as soon as the answer breaks the expected JSON layout)
+sync_streaming = True
+stream_max_chars = 24000
+# Text before the JSON object (prose, fences) is skipped up to this length; JsonRepair extracts the object later
+stream_max_preamble_chars = 400
+
+# Retry policies per error class (attempts include the first call) and circuit breaker
+retry_policies = {
+    "rate_limit": {"max_attempts": 5, "base_delay": 2.0, "max_delay": 60.0},
+    "timeout": {"max_attempts": 3, "base_delay": 2.0, "max_delay": 30.0},
+    "connection": {"max_attempts": 4, "base_delay": 2.0, "max_delay": 60.0},
+    "server": {"max_attempts": 4, "base_delay": 2.0, "max_delay": 60.0},
+    "parse": {"max_attempts": 2, "base_delay": 0.0, "max_delay": 0.0},
+    "client": {"max_attempts": 1},
+    "other": {"max_attempts": 1},
+}
+breaker_failure_threshold = 5
+breaker_reset_seconds = 60
+
+# Failed or expired batch items are resubmitted as follow-up batches at most this many times
+batch_max_resubmits = 2
+
+# Token estimation and budgets (TokenEstimator). Batch input tokens count against the organization's
+# enqueued-token limit until the batch is finished; shards are packed below batch_max_shard_tokens.
+token_calibration_path = "cache/token_calibration.json"
+token_default_chars_per_token = 3.5
+batch_max_shard_tokens = 2000000
+batch_enqueued_token_limit = 5000000
+# USD per 1M tokens for the pre-flight forecast; the Batch API bills half
+model_prices = {
+    "gpt-5.1": {"input": 1.25, "cached": 0.125, "output": 10.0},
+}
+batch_price_factor = 0.5
+
+# Content fingerprints for incremental=1 (requires sql/fingerprint.sql). Off: descriptions are written without
+# chatgpt_fingerprint and incremental runs are refused.
+fingerprint_enabled = False
+
+# Work claiming: products are leased to one worker before they are requested, so several processes or hosts
+# can run in parallel without paying twice (requires sql/leases.sql). Expired leases are taken over.
+# Off: products are read and written without the chatgpt_lease_* columns (only one process at a time).
+lease_enabled = False
+worker_id = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+lease_sync_seconds = 3600
+# Batch leases cover the 24h completion window plus applying the results; every follow-up batch renews them
+lease_batch_seconds = 30 * 3600
+
+# Hybrid mode (mode=2): fresh listings and small queues go through the concurrent sync path, the backlog into batches
+hybrid_fresh_hours = 24
+hybrid_max_sync_items = 200
+hybrid_min_batch_size = 50
+# Batches still not finished after this many hours are cancelled; their finished answers are applied and only the
+# unanswered items are processed synchronously. The hybrid run waits up to hybrid_cancel_wait_minutes for the cancel.
+hybrid_promote_after_hours = 6
+hybrid_cancel_wait_minutes = 15
+
+# Local OE-number knowledge base (OeKnowledgeBase): compatibility rows and sources per OE number, learned from every
+# answer. Sync requests for products whose EAN/UPC numbers are all known go out without web search and get the table
+# from the index; batch answers with an empty table are completed from it.
+oe_kb_enabled = True
+oe_kb_path = "cache/oe_knowledge.sqlite"
+oe_kb_ttl_days = 180
+oe_kb_min_chars = 5
+oe_kb_max_rows = 200
+oe_kb_prompt_hint = ("\n\nHinweis: Kompatibilitätsliste und Quellen zu diesem Artikel liegen bereits vor. "
+                     "Gib \"kompatibilität\" und \"Quelle\" als leere Listen zurück, eine Websuche ist nicht nötig.")
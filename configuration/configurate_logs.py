@@ -1,21 +1,47 @@
+import atexit
 import logging
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener
 import os
 import glob
 import datetime
+import json
+import queue
+import random
+import threading
+from configuration.config import log_level, log_retention_days, log_jsonl, log_payload_sample_rate
 
 LOG_DIR = "log"
+LOGGER_NAME = "SystemLogger"
 
-def setup_logger():
-    if not os.path.exists(LOG_DIR):
-        os.makedirs(LOG_DIR)
+# Attribute eines LogRecord, die nicht als Zusatzfelder (extra=...) in den JSONL-Datensatz gehören
+RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_setup_lock = threading.Lock()
+_listener = None
 
-    today = datetime.datetime.now().strftime("%Y-%m-%d")
-    log_file = os.path.join(LOG_DIR, f"logs_{today}.txt")
+class JsonLineFormatter(logging.Formatter):
+    #The function renders one record as a JSON line; fields passed with extra=... are kept as structured keys.
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "module": record.module,
+            "func": record.funcName,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in RECORD_FIELDS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
 
-    cutoff = datetime.datetime.now() - datetime.timedelta(days=5)
-    for file_path in glob.glob(os.path.join(LOG_DIR, "logs_*.txt")):
-        file_date_str = os.path.basename(file_path).replace("logs_", "").replace(".txt", "")
+#The function deletes log files older than log_retention_days; it runs once per process.
+def cleanup_old_logs():
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=log_retention_days)
+    for file_path in glob.glob(os.path.join(LOG_DIR, "logs_*.*")):
+        file_date_str = os.path.basename(file_path).replace("logs_", "").split(".")[0]
         try:
             file_date = datetime.datetime.strptime(file_date_str, "%Y-%m-%d")
             if file_date < cutoff:
@@ -23,17 +49,59 @@ def setup_logger():
         except:
             pass
 
-    logger = logging.getLogger("SystemLogger")
-    logger.setLevel(logging.INFO)
+#The function returns the shared logger. The first call per process cleans up old logs and starts a background
+#writer thread; every module's log calls only put the record on a queue, file and console I/O happen in that thread.
+def setup_logger():
+    global _listener
+    logger = logging.getLogger(LOGGER_NAME)
+    if _listener is not None:
+        return logger
+
+    with _setup_lock:
+        if _listener is not None:
+            return logger
+
+        if not os.path.exists(LOG_DIR):
+            os.makedirs(LOG_DIR)
+        cleanup_old_logs()
 
-    if not logger.handlers:
-        handler = logging.FileHandler(log_file, encoding="utf-8")
+        today = datetime.datetime.now().strftime("%Y-%m-%d")
         formatter = logging.Formatter("[%(asctime)s] %(message)s", "%Y-%m-%d %H:%M:%S")
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
 
+        handler = logging.FileHandler(os.path.join(LOG_DIR, f"logs_{today}.txt"), encoding="utf-8")
+        handler.setFormatter(formatter)
         console_handler = logging.StreamHandler()
         console_handler.setFormatter(formatter)
-        logger.addHandler(console_handler)
+        handlers = [handler, console_handler]
+
+        if log_jsonl:
+            json_handler = logging.FileHandler(os.path.join(LOG_DIR, f"logs_{today}.jsonl"), encoding="utf-8")
+            json_handler.setFormatter(JsonLineFormatter())
+            handlers.append(json_handler)
+
+        log_queue = queue.SimpleQueue()
+        logger.setLevel(logging.getLevelName(log_level.upper()))
+        logger.propagate = False
+        for existing in list(logger.handlers):
+            logger.removeHandler(existing)
+        logger.addHandler(QueueHandler(log_queue))
+
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        # Beim Beenden die Warteschlange leeren, damit keine Zeilen verloren gehen
+        atexit.register(_listener.stop)
+
+    return logger
+
+#The function logs a full response payload only at DEBUG level or for a sampled share (log_payload_sample_rate) of calls.
+#The JSON dump is built only when the payload is actually logged.
+def log_payload(logger, title, payload):
+    if logger.isEnabledFor(logging.DEBUG):
+        level = logging.DEBUG
+    elif log_payload_sample_rate and random.random() < log_payload_sample_rate:
+        level = logging.INFO
+    else:
+        return
 
-    return logger
\ No newline at end of file
+    pretty_json = json.dumps(payload, ensure_ascii=False, indent=2)
+    logger.log(level, f"\n=== {title} Start ===\n{pretty_json}\n=== {title} End ===\n")
@@ -5,11 +5,35 @@ def print_help():
         📚 Command Line Usage
         1.  python MainController.py mode=1 count=<NUMBER>
             Example: python MainController.py mode=1 count=5
+            count=0 processes the whole backlog page by page.
 
         2.  python MainController.py mode=0 pid=<PRODUCT_ID>
             Example: python MainController.py mode=0 pid=1234
 
-        3.  python MainController.py -h
+            python MainController.py mode=0 count=<NUMBER> workers=<NUMBER>
+            Example: python MainController.py mode=0 count=50 workers=8
+
+            python MainController.py mode=2 count=<NUMBER>
+            Hybrid: fresh listings and items of stuck batches synchronously, the backlog as batches.
+            Example: python MainController.py mode=2 count=0
+
+            Add incremental=1 to any mode to also refresh processed products whose name/EAN/UPC
+            or prompt changed since their description was written (requires sql/fingerprint.sql
+            and fingerprint_enabled = True in configuration/config.py).
+            Example: python MainController.py mode=1 count=0 incremental=1
+
+            Several processes or hosts can work on the backlog in parallel once sql/leases.sql
+            is applied and lease_enabled = True is set in configuration/config.py.
+
+        3.  python MainController.py batch_id=<BATCH_ID>
+            Example: python MainController.py batch_id=batch_6925f34bbe4c81908363074d3c7c9a77
+
+        4.  python MainController.py poll=<MINUTES>
+            Polls all open batches from the local registry and applies finished ones.
+            poll=0 does a single pass (for cron).
+            Example: python MainController.py poll=60
+
+        5.  python MainController.py -h
             python MainController.py --help
             python MainController.py h=1
         """
@@ -0,0 +1,14 @@
+-- Content fingerprint for incremental runs (python MainController.py mode=<0|1|2> incremental=1).
+-- Every write of a description stores SHA-256 over the name, UPC, EAN and prompt text the request was built from
+-- (input_fingerprint / FINGERPRINT_SQL in OpenCartModul.py); an incremental run re-requests a processed product only
+-- when the hash of its current inputs no longer matches.
+-- Set fingerprint_enabled = True in configuration/config.py after running this script.
+ALTER TABLE oc_product ADD COLUMN chatgpt_fingerprint CHAR(64) NULL AFTER chatgpt_calltime;
+
+-- One-time backfill: products described before the column existed get the fingerprint of their current inputs,
+-- so the first incremental run does not regenerate the whole catalog.
+UPDATE oc_product AS p
+    LEFT JOIN oc_product_description AS pd ON pd.product_id = p.product_id AND pd.language_id = 2
+SET p.chatgpt_fingerprint = SHA2(CONCAT_WS(CHAR(31 USING utf8mb4), pd.name, p.upc, p.ean,
+                                 (SELECT prompt_text FROM oc_prompts_ai WHERE prompt_typ = 1)), 256)
+WHERE p.chatgpt_state = 1 AND p.chatgpt_fingerprint IS NULL;
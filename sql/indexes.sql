@@ -0,0 +1,8 @@
+-- Recommended indexes for OpencartProductController.iter_products / __fetch_products.
+-- The backlog query filters on chatgpt_state IS NULL and walks the rows in (ebay_updatetime, product_id)
+-- order; with this index every keyset page is a short range scan instead of a full sort of oc_product.
+CREATE INDEX idx_product_chatgpt_backlog ON oc_product (chatgpt_state, ebay_updatetime, product_id);
+
+-- oc_product_description is joined by product_id and filtered by language_id.
+-- OpenCart already ships PRIMARY KEY (product_id, language_id); create this only if that key is missing.
+-- CREATE INDEX idx_product_description_lang ON oc_product_description (product_id, language_id);
@@ -0,0 +1,6 @@
+-- Work claiming (OpencartProductController.claim_products): a product is leased to one worker before it is
+-- requested, so several processes or hosts can work on the backlog in parallel. Writing the result releases the
+-- lease; a lease whose worker died expires at chatgpt_lease_until and is taken over by the next run.
+ALTER TABLE oc_product
+    ADD COLUMN chatgpt_lease_owner VARCHAR(64) NULL AFTER chatgpt_calltime,
+    ADD COLUMN chatgpt_lease_until DATETIME NULL AFTER chatgpt_lease_owner;
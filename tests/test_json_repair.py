@@ -0,0 +1,25 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from JsonRepair import close_truncated
+
+HEAD = '{"titel": "Katalysator", "OE-Nummer": ["1K0253058", "1K0 2'
+
+def test_truncated_row_is_dropped_not_completed():
+    text = '{"titel": "Katalysator", "kompatibilität": [{"marke": "VW", "modell": "Golf V"}, {"marke": "VW", "modell": "Go'
+    result = json.loads(close_truncated(text))
+    assert result["kompatibilität"] == [{"marke": "VW", "modell": "Golf V"}]
+
+def test_unclosed_row_with_complete_values_is_dropped():
+    text = '{"kompatibilität": [{"marke": "VW", "modell": "Golf V"}, {"marke": "Seat", "modell": "Leon"'
+    assert json.loads(close_truncated(text)) == {"kompatibilität": [{"marke": "VW", "modell": "Golf V"}]}
+
+def test_truncated_list_element_is_dropped():
+    assert json.loads(close_truncated(HEAD)) == {"titel": "Katalysator", "OE-Nummer": ["1K0253058"]}
+
+def test_truncated_string_value_drops_its_key():
+    text = '{"titel": "Katalysator", "Verkaufstext": "Hochwertiger Kat'
+    assert json.loads(close_truncated(text)) == {"titel": "Katalysator"}